@@ -1,13 +1,12 @@
 import sys
 
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 
 pdfs = sys.argv[1]
-pages = convert_from_path(pdfs, 350)
 
-i = 1
-for page in pages:
+# Render one page at a time so only a single page is ever held in memory
+for i in range(1, pdfinfo_from_path(pdfs)["Pages"] + 1):
+    page = convert_from_path(pdfs, 350, first_page=i, last_page=i)[0]
     image_name = pdfs + "-Page_" + str(i) + ".png"
     page.save(image_name, "PNG")
     print(f"{pdfs} -> {image_name} ")
-    i = i+1
\ No newline at end of file
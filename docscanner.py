@@ -2,18 +2,41 @@
 # -*- coding: utf-8 -*-
 import argparse
 import base64
+import bisect
+import concurrent.futures
+import contextlib
+import copy
+import ctypes
+import gzip
+import hashlib
+import io
+import itertools
+import json
 import logging
+import mmap
+import multiprocessing
 import os
+import queue
+import random
 import re
+import select
+import signal
 import smtplib
+import sqlite3
 import ssl
+import struct
+import subprocess
 import sys
+import tempfile
+import threading
 import typing
+import urllib.parse
+import uuid
 import xmlrpc.client
 from email.message import EmailMessage
 from pathlib import Path
 from smtplib import SMTP
-from time import sleep
+from time import gmtime, monotonic, sleep, time
 from typing import Any
 
 try:
@@ -28,12 +51,23 @@ except ImportError:
     print("The opencv-python module is not installed.", sys.stderr)
     sys.exit(1)
 
+try:
+    import numpy as np
+except ImportError:
+    print("The numpy module is not installed.", sys.stderr)
+    sys.exit(1)
+
 try:
     import pytesseract
 except ImportError:
     print("The pytesseract module is not installed.", sys.stderr)
     sys.exit(1)
 
+# tesserocr is optional, without it we fall back to the pytesseract engine. It is imported by _import_tesserocr()
+# when the engine is first needed, not here: importing it loads tesseract's OpenMP runtime, which only reads
+# OMP_THREAD_LIMIT when it is loaded, and main() sets that after this module is loaded.
+tesserocr = None
+
 try:
     import yaml
 except ImportError:
@@ -47,11 +81,431 @@ except ImportError:
     sys.exit(1)
 
 try:
-    from PIL import Image
+    from PIL import Image, ImageOps, ImageSequence
 except ImportError:
     print("The Pillow module is not installed.", sys.stderr)
     sys.exit(1)
 
+# pypdf is optional, without it PDFs are always rasterized and read with OCR
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+PDF_MIME_TYPE: str = "application/pdf"
+TIFF_MIME_TYPE: str = "image/tiff"
+
+# The formats documents can be converted to for upload and mail, see DocumentImage.upload
+OUTPUT_FORMATS: dict[str, tuple[str, str]] = {
+    'tiff-g4': (TIFF_MIME_TYPE, '.tif'),
+    'jpeg': ("image/jpeg", '.jpg'),
+    'webp': ("image/webp", '.webp'),
+    'pdf': (PDF_MIME_TYPE, '.pdf')}
+
+# The document type keys that can change the name read from a document, see OCRCache. The hot zone and region order
+# learned from the statistics aren't among them, they only change where the name is looked for first.
+OCR_CACHE_KEYS: tuple[str, ...] = (
+    'regions', 'ocr_regex', 'odoo_sequence', 'threshold_region_ignore', 'threshold_region_ignore_min',
+    'threshold_region_ignore_decrement', 'threshold_search', 'threshold_max_steps', 'adaptive_threshold',
+    'adaptive_regions', 'region_exploration_rate', 'hot_zone', 'barcode', 'text_layer_min_chars', 'decode_scale',
+    'detection_max_pixels', 'mosaic_gap')
+
+
+def render_pdf_page(filename: str, page: int, dpi: int, pdftoppm: str = "pdftoppm",
+                    box: typing.Optional[tuple[int, int, int, int]] = None, data: typing.Optional[bytes] = None
+                    ) -> np.ndarray:
+    """
+    Renders one page of a PDF, or part of it, to a grayscale image with poppler's pdftoppm
+
+    :param filename: the PDF file, only used in error messages if data is given
+    :type filename: str
+    :param page: page number, starting at 1
+    :type page: int
+    :param dpi: resolution to render at
+    :type dpi: int
+    :param pdftoppm: the pdftoppm executable
+    :type pdftoppm: str
+    :param box: only render this part of the page, (x0, y0, x1, y1) in pixels at dpi
+    :type box: tuple[int, int, int, int]
+    :param data: the contents of the PDF, piped to pdftoppm instead of it reading the file
+    :type data: bytes
+    :return: the page
+    :rtype: np.ndarray
+    """
+
+    args: list[str] = [pdftoppm, '-gray', '-png', '-r', str(dpi), '-f', str(page), '-l', str(page)]
+    if box:
+        x0, y0, x1, y1 = box
+        args += ['-x', str(x0), '-y', str(y0), '-W', str(max(x1 - x0, 1)), '-H', str(max(y1 - y0, 1))]
+
+    result = subprocess.run(args + ['-' if data is not None else filename], input=data, capture_output=True,
+                            check=True)
+
+    image: typing.Optional[np.ndarray] = cv2.imdecode(np.frombuffer(result.stdout, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Page {page} of {filename} could not be rendered: {result.stderr.decode(errors='replace')}")
+
+    return image
+
+
+class OCREngine:
+
+    name: str = ""
+
+    def __init__(self, config: dict) -> None:
+        """
+        Base class for the OCR engines used by DocumentImage. Engines are created once per process by
+        get_ocr_engine() and take numpy images (e.g. crops of a scan) directly.
+
+        :param config: configuration from YAML file
+        :type config: dict
+        """
+
+        self.config: dict = config
+        self.logger: logging.Logger = config['logger']
+
+    @property
+    def version(self) -> str:
+        """
+        The version of the underlying tesseract library
+        :return: tesseract version
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def image_to_string(self, image: np.ndarray) -> str:
+        """
+        Runs OCR on the image and returns the text found
+        :param image: grayscale or BGR image
+        :type image: np.ndarray
+        :return: the text in the image
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def image_to_data(self, image: np.ndarray) -> list[tuple[int, int, int, int, int, str]]:
+        """
+        Runs OCR on the image and returns the words found with their bounding boxes
+        :param image: grayscale or BGR image
+        :type image: np.ndarray
+        :return: (line, left, top, width, height, text) for each word, line numbers count up through the image
+        :rtype: list[tuple[int, int, int, int, int, str]]
+        """
+        raise NotImplementedError
+
+
+class PytesseractEngine(OCREngine):
+    """
+    Runs the tesseract binary once per image through pytesseract. Slow, but it only needs the tesseract executable.
+    """
+
+    name = "pytesseract"
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+
+        # get path to tesseract from config
+        pytesseract.pytesseract.tesseract_cmd = config['tesseract-bin']
+
+    @property
+    def version(self) -> str:
+        # Asking means running the tesseract binary, so only do it once
+        if not getattr(self, '_version', ''):
+            self._version: str = str(pytesseract.get_tesseract_version())
+        return self._version
+
+    def image_to_string(self, image: np.ndarray) -> str:
+        return str(pytesseract.image_to_string(image, config='--psm 6'))
+
+    def image_to_data(self, image: np.ndarray) -> list[tuple[int, int, int, int, int, str]]:
+        data: dict = pytesseract.image_to_data(image, config='--psm 6', output_type=pytesseract.Output.DICT)
+
+        words: list = []
+        lines: dict = {}
+        for i, text in enumerate(data['text']):
+            if data['level'][i] != 5 or not str(text).strip():
+                continue
+            line: int = lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), len(lines))
+            words.append((line, data['left'][i], data['top'][i], data['width'][i], data['height'][i], str(text)))
+
+        return words
+
+
+class TesserocrEngine(OCREngine):
+    """
+    Keeps the tesseract library and its traineddata loaded in this process and hands it the image buffer directly,
+    so there is no subprocess or temporary file per image. The tesseract API is not thread safe, so each thread
+    gets its own instance.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+
+        self.language: str = config.get('ocr-language', 'eng')
+        self.tessdata: str = config.get('tessdata-path', '')
+        self._local = threading.local()
+
+    @property
+    def api(self) -> "tesserocr.PyTessBaseAPI":
+        """
+        The tesseract API for the current thread, initialized on first use
+        :return: tesseract API
+        :rtype: tesserocr.PyTessBaseAPI
+        """
+
+        api = getattr(self._local, 'api', None)
+
+        if api is None:
+            kwargs: dict = {'lang': self.language, 'psm': tesserocr.PSM.SINGLE_BLOCK}
+            if self.tessdata:
+                kwargs['path'] = self.tessdata
+
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            self._local.api = api
+            self.logger.debug(f"Loaded tesseract {self.version} language: {self.language}")
+
+        return api
+
+    @property
+    def version(self) -> str:
+        return tesserocr.tesseract_version().split()[1]
+
+    def image_to_string(self, image: np.ndarray) -> str:
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bytes_per_pixel: int = 1 if image.ndim == 2 else image.shape[2]
+
+        self.api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        return self.api.GetUTF8Text()
+
+    def image_to_data(self, image: np.ndarray) -> list[tuple[int, int, int, int, int, str]]:
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bytes_per_pixel: int = 1 if image.ndim == 2 else image.shape[2]
+
+        api = self.api
+        api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        api.Recognize()
+
+        words: list = []
+        line: int = -1
+        for word in tesserocr.iterate_level(api.GetIterator(), tesserocr.RIL.WORD):
+            if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line += 1
+            text: str = word.GetUTF8Text(tesserocr.RIL.WORD) or ''
+            box = word.BoundingBox(tesserocr.RIL.WORD)
+            if not text.strip() or box is None:
+                continue
+            x0, y0, x1, y1 = box
+            words.append((max(line, 0), x0, y0, x1 - x0, y1 - y0, text))
+
+        return words
+
+
+OCR_ENGINES: dict = {engine.name: engine for engine in (PytesseractEngine, TesserocrEngine)}
+
+
+def _import_tesserocr() -> bool:
+    """
+    Imports tesserocr the first time it is needed, see the note where it is declared
+    :return: whether tesserocr is installed
+    :rtype: bool
+    """
+
+    global tesserocr
+
+    if tesserocr is None:
+        try:
+            import tesserocr
+        except ImportError:
+            return False
+
+    return True
+
+# One engine per process, see get_ocr_engine()
+_ocr_engines: dict = {}
+_ocr_engines_lock = threading.Lock()
+
+
+def get_ocr_engine(config: dict) -> OCREngine:
+    """
+    Returns the OCR engine selected by the 'ocr-engine' key in the configuration. The engine is created on first
+    use and then reused for the life of the process.
+
+    :param config: configuration from YAML file
+    :type config: dict
+    :return: the OCR engine
+    :rtype: OCREngine
+    """
+
+    engine_name: str = config.get('ocr-engine', TesserocrEngine.name)
+
+    with _ocr_engines_lock:
+        if engine_name not in _ocr_engines:
+            if engine_name not in OCR_ENGINES:
+                raise ValueError(f"Unknown ocr-engine {engine_name}. Valid engines: {', '.join(OCR_ENGINES)}")
+
+            engine_class: type = OCR_ENGINES[engine_name]
+
+            if engine_class is TesserocrEngine and not _import_tesserocr():
+                config['logger'].warning("The tesserocr module is not installed. Falling back to pytesseract.")
+                engine_class = PytesseractEngine
+
+            _ocr_engines[engine_name] = engine_class(config)
+
+        return _ocr_engines[engine_name]
+
+
+class OCRCache:
+
+    def __init__(self, config: dict) -> None:
+        """
+        A cache of names read from documents, kept in the SQLite file 'ocr-cache-file'. Entries are keyed by the
+        image's content hash and everything that can change what OCR reads from it: the document type's
+        OCR_CACHE_KEYS, the PDF resolutions and the OCR engine, its language and version. Keys that only say what
+        happens to the document afterwards, e.g. odoo_object or output, don't invalidate the cache. It holds up to
+        'ocr-cache-size' entries, the least recently used are evicted first.
+
+        :param config: configuration from YAML file
+        :type config: dict
+        """
+
+        self.config: dict = config
+        self.logger: logging.Logger = config['logger']
+        self.size: int = config.get('ocr-cache-size', 10000)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(config['ocr-cache-file'], check_same_thread=False, timeout=30)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS ocr_cache ("
+                             "key TEXT PRIMARY KEY, name TEXT, region INTEGER, threshold INTEGER, used REAL, "
+                             "region_box TEXT DEFAULT '[]')")
+            # Caches made before the region's box was stored
+            if 'region_box' not in [column[1] for column in self._db.execute("PRAGMA table_info(ocr_cache)")]:
+                self._db.execute("ALTER TABLE ocr_cache ADD COLUMN region_box TEXT DEFAULT '[]'")
+            self._db.execute("CREATE INDEX IF NOT EXISTS ocr_cache_used ON ocr_cache (used)")
+
+    def _key(self, document: "DocumentImage") -> str:
+        """
+        The cache key of a document
+        :param document:
+        :type document: DocumentImage
+        :return: hex digest
+        :rtype: str
+        """
+
+        engine: OCREngine = get_ocr_engine(self.config)
+        document_config: dict = self.config['documents'][document.document_type]
+        ocr_config: str = json.dumps(
+            [{key: document_config.get(key) for key in OCR_CACHE_KEYS},
+             # speculative reads the same regions in the same order as serial, only sooner
+             'mosaic' if document_config.get('ocr_mode') == 'mosaic' else 'serial',
+             self.config.get('pdf-dpi', 350), self.config.get('pdf-detection-dpi'),
+             engine.name, engine.version, self.config.get('ocr-language', 'eng')],
+            sort_keys=True, default=str)
+
+        # a single page of a batch scan, see DocumentImage.page_names()
+        pages: str = f":{document.first_page}-{document.last_page}" if document.last_page else ""
+
+        return hashlib.sha256(f"{document.content_hash}{pages}:{ocr_config}".encode()).hexdigest()
+
+    def get(self, document: "DocumentImage") -> tuple[str, int, list[float], int]:
+        """
+        Looks up a document's name
+        :param document:
+        :type document: DocumentImage
+        :return: the name, the region, the region's box and the threshold it was found with. An empty name if it is
+        not cached.
+        :rtype: tuple[str, int, list[float], int]
+        """
+
+        key: str = self._key(document)
+
+        with self._lock, self._db:
+            row = self._db.execute("SELECT name, region, region_box, threshold FROM ocr_cache WHERE key = ?",
+                                   (key,)).fetchone()
+            if not row:
+                return "", 0, [], 0
+
+            self._db.execute("UPDATE ocr_cache SET used = ? WHERE key = ?", (time(), key))
+
+        name, region, region_box, threshold = row
+        return name, region, json.loads(region_box or '[]'), threshold
+
+    def put(self, document: "DocumentImage") -> None:
+        """
+        Stores a document's name with the region, region box and threshold it was found with
+        :param document:
+        :type document: DocumentImage
+        :return: None
+        :rtype: None
+        """
+
+        key: str = self._key(document)
+
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO ocr_cache (key, name, region, region_box, threshold, used) "
+                             "VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, document._name, document.region, json.dumps(document.region_box),
+                              document.threshold_region_ignore, time()))
+            self._db.execute("DELETE FROM ocr_cache WHERE key IN "
+                             "(SELECT key FROM ocr_cache ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.size,))
+
+
+# One cache per process, see get_ocr_cache()
+_ocr_caches: dict = {}
+_ocr_caches_lock = threading.Lock()
+
+
+def get_ocr_cache(config: dict) -> typing.Optional[OCRCache]:
+    """
+    Returns the OCR cache from the 'ocr-cache-file' key in the configuration, or None if there isn't one. The cache is
+    opened on first use and then reused for the life of the process.
+
+    :param config: configuration from YAML file
+    :type config: dict
+    :return: the OCR cache
+    :rtype: OCRCache
+    """
+
+    cache_file: str = config.get('ocr-cache-file', '')
+    if not cache_file:
+        return None
+
+    with _ocr_caches_lock:
+        if cache_file not in _ocr_caches:
+            _ocr_caches[cache_file] = OCRCache(config)
+
+        return _ocr_caches[cache_file]
+
+
+# One thread pool per process for ocr_mode: speculative, see get_ocr_executor()
+_ocr_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+_ocr_executor_lock = threading.Lock()
+
+
+def get_ocr_executor(config: dict) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Returns the thread pool regions are read on with ocr_mode: speculative. It has 'ocr-threads' threads (default
+    the number of CPUs), is created on first use and then reused for the life of the process.
+
+    :param config: configuration from YAML file
+    :type config: dict
+    :return: the thread pool
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+
+    global _ocr_executor
+
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=config.get('ocr-threads', os.cpu_count() or 1), thread_name_prefix="ocr")
+
+        return _ocr_executor
+
 
 class DocumentImage:
 
@@ -77,11 +531,32 @@ class DocumentImage:
         self.odoo_attachment_id: int = 0
         self.odoo_document_id: int = 0
         self.is_emailed: bool = False
+        self.region: int = 0
+        # The page being read, and for multi-page files the one the name was found on
+        self.page: int = 1
+        self._page_count: int = 0
+        # The pages to read the name from, last_page 0 is the end of the file
+        self.first_page: int = 1
+        self.last_page: int = 0
+        # The batch scan this document was split from, see FileManager.split()
+        self.source: typing.Optional[Path] = None
+        # The found region's bounding box as fractions of the image's width and height (x0, y0, x1, y1)
+        self.region_box: list[float] = []
+        self._content_hash: str = ""
+        self._checksum: str = ""
+        # The file's contents, read once, see data
+        self._data: typing.Optional[typing.Union[bytes, mmap.mmap]] = None
+        # The contents, mime type and file name uploaded and mailed, see upload
+        self._upload: typing.Optional[tuple[typing.Union[bytes, mmap.mmap], str, str]] = None
         self._odoo_sequence: str = ""
         self._threshold_region_ignore: int = 0
         self.regex: re.Pattern = re.compile("")
         self._regions_list: list[list[int]] = []
 
+        # The decoded image and the bounding rectangles (x, y, w, h) of all its text regions, see _find_regions()
+        self._image: typing.Optional[np.ndarray] = None
+        self._regions: typing.Optional[np.ndarray] = None
+
         self.config = config
         self.logger = config['logger']
 
@@ -91,6 +566,185 @@ class DocumentImage:
             self.regex = re.compile(config['documents'][self.document_type]['ocr_regex'])
             self._regions_list = config['documents'][self.document_type]['regions']
 
+    def __getstate__(self) -> dict:
+        """
+        DocumentImages are passed between processes by the Pipeline. The file's contents and decoded image are too
+        big to be worth sending and the configuration belongs to the receiving process, which has to set config and
+        logger again.
+        :return: the object's state for pickling
+        :rtype: dict
+        """
+
+        state: dict = self.__dict__.copy()
+        for key in ('config', 'logger', '_image', '_regions', '_data', '_upload'):
+            state[key] = None
+
+        return state
+
+    @property
+    def content_hash(self) -> str:
+        """
+        SHA-256 of the file's contents, identifying the document no matter what the file is called or where it is
+        :return: hex digest
+        :rtype: str
+        """
+
+        if not self._content_hash:
+            self._content_hash = hashlib.sha256(self.data).hexdigest()
+
+        return self._content_hash
+
+    @property
+    def checksum(self) -> str:
+        """
+        SHA-1 of the uploaded contents, the same as Odoo keeps in ir.attachment.checksum
+        :return: hex digest
+        :rtype: str
+        """
+
+        if not self._checksum:
+            self._checksum = hashlib.sha1(self.upload[0]).hexdigest()
+
+        return self._checksum
+
+    @property
+    def data(self) -> typing.Union[bytes, mmap.mmap]:
+        """
+        The contents of the file. It is read once, and mime type detection, hashing, decoding, upload and mail all
+        use this buffer, which matters when the inbox is on a network share. With 'mmap-files' set the file is
+        memory-mapped instead of read, so pages are only fetched as they are used.
+        :return: the file's contents
+        :rtype: bytes or mmap.mmap
+        """
+
+        if self._data is None:
+            with self.file.open('rb') as f:
+                if self.config.get('mmap-files') and self.file.stat().st_size:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self._data = f.read()
+
+        return self._data
+
+    def close(self) -> None:
+        """
+        Lets go of the file's contents and decoded image once the document has been dealt with
+        :return: None
+        :rtype: None
+        """
+
+        self._data = None
+        self._upload = None
+        self._image = None
+        self._regions = None
+
+    @property
+    def upload(self) -> tuple[typing.Union[bytes, mmap.mmap], str, str]:
+        """
+        The document as it is uploaded to Odoo and mailed, converted by the document type's output profile if it has
+        one, or else the file as it is. The name is always read from the original.
+        :return: contents, mime type and file name
+        :rtype: tuple[bytes, str, str]
+        """
+
+        if self._upload is None:
+            profile: typing.Optional[dict] = None
+            if self.document_type:
+                profile = self.config['documents'][self.document_type].get('output')
+            self._upload = self._convert(profile) if profile else (self.data, self.mime_type, self.file.name)
+
+        return self._upload
+
+    def _convert(self, profile: dict) -> tuple[typing.Union[bytes, mmap.mmap], str, str]:
+        """
+        Converts the file by an output profile, which for black text on white is many times smaller than a colour
+        scan. The profile has:
+        format: tiff-g4 (bilevel CCITT group 4), jpeg or webp (grayscale) or pdf (grayscale JPEG pages, or bilevel with
+        bilevel set), default tiff-g4
+        dpi: pages with a higher resolution are scaled down to this, default 200
+        quality: JPEG and WebP quality, default 60
+        threshold: the gray level splitting black from white for bilevel output, default 160
+        Multi-page files keep all their pages, so they stay as they are for jpeg and webp. The file is also left as
+        it is if the conversion fails or isn't smaller.
+        :param profile: the document type's output profile
+        :type profile: dict
+        :return: contents, mime type and file name
+        :rtype: tuple[bytes, str, str]
+        """
+
+        original: tuple[typing.Union[bytes, mmap.mmap], str, str] = (self.data, self.mime_type, self.file.name)
+        output_format: str = profile.get('format', 'tiff-g4')
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format}. Valid formats: {', '.join(OUTPUT_FORMATS)}")
+        mime_type, suffix = OUTPUT_FORMATS[output_format]
+
+        dpi: int = profile.get('dpi', 200)
+        quality: int = profile.get('quality', 60)
+        threshold: int = profile.get('threshold', 160)
+        bilevel: bool = output_format == 'tiff-g4' or profile.get('bilevel', False)
+
+        # A file that can't be converted, e.g. because it is damaged, is still uploaded or mailed as it is
+        try:
+            if self.page_count > 1 and output_format in ('jpeg', 'webp'):
+                self.logger.warning(f"{self.filename} has {self.page_count} pages, it is uploaded as it is")
+                return original
+
+            pages: list[Image.Image] = []
+            for page in self._output_pages(dpi):
+                if bilevel:
+                    page = page.point(lambda value: 255 if value > threshold else 0, mode='1')
+                pages.append(page)
+
+            output = io.BytesIO()
+            if output_format == 'tiff-g4':
+                pages[0].save(output, 'TIFF', save_all=True, append_images=pages[1:], compression='group4',
+                              dpi=(dpi, dpi))
+            elif output_format == 'pdf':
+                # Pillow stamps PDFs with the time they were made, fix it so the same file always gives the same
+                # checksum and is found in Odoo again, see OdooConnector._existing_attachments()
+                pages[0].save(output, 'PDF', save_all=True, append_images=pages[1:], resolution=dpi,
+                              quality=quality, title=self.file.stem, creationDate=gmtime(0), modDate=gmtime(0))
+            elif output_format == 'jpeg':
+                pages[0].save(output, 'JPEG', quality=quality, optimize=True, progressive=True, dpi=(dpi, dpi))
+            else:
+                pages[0].save(output, 'WEBP', quality=quality)
+        except Exception as e:
+            self.logger.warning(f"{self.filename} could not be converted to {output_format}, it is uploaded as it "
+                                f"is: {e}")
+            return original
+
+        if output.tell() >= len(self.data):
+            self.logger.debug(f"{self.filename} is no smaller as {output_format}, it is uploaded as it is")
+            return original
+
+        self.logger.debug(f"{self.filename} converted to {output_format}: {len(self.data)} -> {output.tell()} bytes")
+        return output.getvalue(), mime_type, self.file.with_suffix(suffix).name
+
+    def _output_pages(self, dpi: int) -> typing.Iterator[Image.Image]:
+        """
+        The pages of the file in grayscale at no more than dpi, for _convert(). PDFs are rendered at dpi, images
+        without a resolution are taken to be at dpi already.
+        :param dpi: the highest resolution
+        :type dpi: int
+        :return: the pages
+        :rtype: typing.Iterator[Image.Image]
+        """
+
+        if self.mime_type == PDF_MIME_TYPE:
+            for page in range(1, self.page_count + 1):
+                yield Image.fromarray(render_pdf_page(self.filename, page, dpi,
+                                                      self.config.get('pdftoppm-bin', 'pdftoppm'), data=self.data))
+            return
+
+        with Image.open(io.BytesIO(self.data)) as image:
+            for frame in ImageSequence.Iterator(image):
+                page: Image.Image = ImageOps.exif_transpose(frame.convert('L'))
+                image_dpi: float = float(frame.info.get('dpi', (dpi, dpi))[0]) or dpi
+                if image_dpi > dpi:
+                    page = page.resize((round(page.width * dpi / image_dpi), round(page.height * dpi / image_dpi)),
+                                       Image.Resampling.LANCZOS)
+                yield page
+
     @property
     def filename(self) -> str:
         """
@@ -144,25 +798,245 @@ class DocumentImage:
         image, line_items_coordinates = self._mark_region()
 
         # the invoice number usually lives in regions -1 to -3
-        for regions in self._regions_list:
-            for i in regions:
-                try:
-                    t: str = self._read_text(image, line_items_coordinates, -i).replace('\n', ' ')
-                    self.logger.debug(f'Reading {self.filename} region: {i} result: {t}')
-                    m: re.Match = self.regex.search(t)
-                    document_str = m.group(1)
-                    if 'statistics' in self.config:
-                        count: int = self.config['statistics'][self.document_type].setdefault(i, 0) + 1
-                        self.config['statistics'][self.document_type][i] = count
-                        self.logger.debug(f'Region: {i} found {document_str} in document string: {t}')
+        regions: list[int] = [i for regions in self._region_order() for i in regions
+                              if 0 < i <= len(line_items_coordinates)]
+
+        ocr_mode: str = self.config['documents'][self.document_type].get('ocr_mode', 'serial')
+        if ocr_mode == 'mosaic':
+            texts = self._mosaic_texts(image, line_items_coordinates, regions)
+        elif ocr_mode == 'speculative':
+            texts = self._speculative_texts(image, line_items_coordinates, regions)
+        else:
+            texts = self._region_texts(image, line_items_coordinates, regions)
+
+        # closing the generator stops any reading still to be done once a region matches
+        with contextlib.closing(texts):
+            for i, t in texts:
+                t = t.replace('\n', ' ')
+                self.logger.debug(f'Reading {self.filename} region: {i} result: {t}')
+                m: typing.Optional[re.Match] = self.regex.search(t)
+                if not m:
+                    continue
 
-                    return document_str
+                document_str = m.group(1)
+                self.region = i
+                c = line_items_coordinates[-i]
+                height, width = image.shape[:2]
+                self.region_box = [c[0][0] / width, c[0][1] / height, c[1][0] / width, c[1][1] / height]
+                if 'statistics' in self.config:
+                    self.record_statistics()
+                    self.logger.debug(f'Region: {i} found {document_str} in document string: {t}')
 
-                except Exception:
-                    continue
+                return document_str
 
         return document_str
 
+    def _region_texts(self, image: np.ndarray, line_items_coordinates: list,
+                      regions: list[int]) -> typing.Iterator[tuple[int, str]]:
+        """
+        Reads the regions one at a time, one OCR call each, so that reading stops at the first region that matches
+        :param image: decoded image
+        :type image: np.ndarray
+        :param line_items_coordinates: region coordinates from _mark_region()
+        :type line_items_coordinates: list
+        :param regions: regions to read, counted from the end of line_items_coordinates, in priority order
+        :type regions: list[int]
+        :return: (region, text) in priority order
+        :rtype: typing.Iterator[tuple[int, str]]
+        """
+
+        for i in regions:
+            try:
+                yield i, self._read_text(image, line_items_coordinates, -i)
+            except Exception as e:
+                self.logger.debug(f'Reading {self.filename} region: {i} failed: {e}')
+
+    def _speculative_texts(self, image: np.ndarray, line_items_coordinates: list,
+                           regions: list[int]) -> typing.Iterator[tuple[int, str]]:
+        """
+        Reads the next speculative_regions regions (default 4) at the same time on the get_ocr_executor() thread
+        pool, ahead of the region the caller is waiting for. Texts still come back in priority order, so the first
+        match is the same as with ocr_mode: serial. Reads that haven't started when the generator is closed are
+        cancelled, ones already running are left to finish and their results are dropped.
+        :param image: decoded image
+        :type image: np.ndarray
+        :param line_items_coordinates: region coordinates from _mark_region()
+        :type line_items_coordinates: list
+        :param regions: regions to read, counted from the end of line_items_coordinates, in priority order
+        :type regions: list[int]
+        :return: (region, text) in priority order
+        :rtype: typing.Iterator[tuple[int, str]]
+        """
+
+        ahead: int = max(self.config['documents'][self.document_type].get('speculative_regions', 4), 1)
+        executor: concurrent.futures.ThreadPoolExecutor = get_ocr_executor(self.config)
+
+        futures: list[concurrent.futures.Future] = []
+        try:
+            for n, i in enumerate(regions):
+                while len(futures) < min(n + ahead, len(regions)):
+                    futures.append(executor.submit(self._read_text, image, line_items_coordinates,
+                                                   -regions[len(futures)]))
+                try:
+                    yield i, futures[n].result()
+                except Exception as e:
+                    self.logger.debug(f'Reading {self.filename} region: {i} failed: {e}')
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _mosaic_texts(self, image: np.ndarray, line_items_coordinates: list,
+                      regions: list[int]) -> typing.Iterator[tuple[int, str]]:
+        """
+        Reads all the regions with a single OCR call. The crops are stacked into one image, separated by white
+        bands of mosaic_gap pixels (default 40) so tesseract doesn't join their lines, and each word found is given
+        back to the crop its box falls in. Used with ocr_mode: mosaic, which pays off when the name is rarely in the
+        first region tried.
+        :param image: decoded image
+        :type image: np.ndarray
+        :param line_items_coordinates: region coordinates from _mark_region()
+        :type line_items_coordinates: list
+        :param regions: regions to read, counted from the end of line_items_coordinates, in priority order
+        :type regions: list[int]
+        :return: (region, text) in priority order
+        :rtype: typing.Iterator[tuple[int, str]]
+        """
+
+        if not regions:
+            return
+
+        gap: int = self.config['documents'][self.document_type].get('mosaic_gap', 40)
+        crops: list[np.ndarray] = []
+        for i in regions:
+            c = line_items_coordinates[-i]
+            crops.append(self._binarize(self._crop(image, c)))
+
+        width: int = max(crop.shape[1] for crop in crops) + 2 * gap
+        height: int = sum(crop.shape[0] for crop in crops) + gap * (len(crops) + 1)
+        mosaic: np.ndarray = np.full((height, width), 255, dtype=np.uint8)
+
+        # the first row of each crop in the mosaic
+        tops: list[int] = []
+        y: int = gap
+        for crop in crops:
+            mosaic[y:y + crop.shape[0], gap:gap + crop.shape[1]] = crop
+            tops.append(y)
+            y += crop.shape[0] + gap
+
+        try:
+            words: list = self.ocr_engine.image_to_data(mosaic)
+        except Exception as e:
+            self.logger.debug(f'Reading {self.filename} mosaic of {len(regions)} regions failed: {e}')
+            return
+
+        lines: list[dict] = [{} for _ in regions]
+        for line, left, top, _, word_height, text in words:
+            middle: int = top + word_height // 2
+            index: int = max(bisect.bisect_right(tops, middle) - 1, 0)
+            lines[index].setdefault(line, []).append((left, text))
+
+        for i, crop_lines in zip(regions, lines):
+            yield i, '\n'.join(' '.join(text for _, text in sorted(crop_lines[line])) for line in sorted(crop_lines))
+
+    def _thresholds(self) -> list[int]:
+        """
+        The values of threshold_region_ignore to read the image with, in the order to try them. They run from the
+        current threshold down to threshold_region_ignore_min in steps of threshold_region_ignore_decrement.
+
+        With threshold_search: bisect, the steps are tried coarse to fine: both ends of the range, then the middle,
+        then the middles of each half and so on, giving up after threshold_max_steps (default log2 of the number of
+        steps plus one). threshold_max_steps also limits the default linear search. With adaptive_threshold and
+        --stats on, the thresholds that found the most names come first.
+        :return: thresholds
+        :rtype: list[int]
+        """
+
+        document_config: dict = self.config['documents'][self.document_type]
+        steps: list[int] = list(range(self.threshold_region_ignore, document_config['threshold_region_ignore_min'] - 1,
+                                      -document_config['threshold_region_ignore_decrement']))
+        max_steps: int = document_config.get('threshold_max_steps', len(steps))
+
+        if document_config.get('threshold_search', 'linear') == 'bisect':
+            max_steps = document_config.get('threshold_max_steps', len(steps).bit_length() + 1)
+
+            order: list[int] = [0, len(steps) - 1] if len(steps) > 1 else list(range(len(steps)))
+            ranges: list[tuple[int, int]] = [(0, len(steps) - 1)]
+            while ranges:
+                low, high = ranges.pop(0)
+                if high - low > 1:
+                    middle: int = (low + high) // 2
+                    order.append(middle)
+                    ranges.extend([(low, middle), (middle, high)])
+            steps = [steps[i] for i in order]
+
+        statistics: dict = self.config.get('statistics', {}).get(self.document_type) or {}
+        if document_config.get('adaptive_threshold') and statistics.get('thresholds'):
+            # sorted() is stable, so thresholds with the same count keep their place
+            steps.sort(key=lambda threshold: statistics['thresholds'].get(threshold, 0), reverse=True)
+
+        return steps[:max_steps]
+
+    def _region_order(self) -> list[list[int]]:
+        """
+        The regions to read, in the order to try them. Normally that is the order in the configuration. With
+        adaptive_regions set for the document type and --stats on, the regions that found the most names come first.
+        A region_exploration_rate (default 0.05) share of documents try the regions in random order instead, so
+        other regions that also find names get counted and the order can follow a change of layout.
+        :return: lists of regions
+        :rtype: list[list[int]]
+        """
+
+        document_config: dict = self.config['documents'][self.document_type]
+        statistics: dict = self.config.get('statistics', {}).get(self.document_type) or {}
+
+        if not document_config.get('adaptive_regions') or not statistics:
+            return self._regions_list
+
+        regions: list[int] = [region for regions in self._regions_list for region in regions]
+
+        if random.random() < document_config.get('region_exploration_rate', 0.05):
+            random.shuffle(regions)
+            return [regions]
+
+        # sorted() is stable, so regions with the same count stay in configuration order
+        return [sorted(regions, key=lambda region: statistics.get(region, 0), reverse=True)]
+
+    def record_statistics(self) -> None:
+        """
+        Counts the region and threshold the document's name was found with, if statistics are being kept. The hot zone
+        covers the regions of the last hot_zone_window (default 50) names found, less the hot_zone_outliers (default
+        0.1) of them that reach furthest out on each side, so a name found somewhere unusual, e.g. while exploring
+        region orders, doesn't widen it for good.
+        :return: None
+        :rtype: None
+        """
+
+        if 'statistics' in self.config and (self.region or self.region_box):
+            if self.region:
+                count: int = self.config['statistics'][self.document_type].setdefault(self.region, 0) + 1
+                self.config['statistics'][self.document_type][self.region] = count
+
+            thresholds: dict = self.config['statistics'][self.document_type].setdefault('thresholds', {})
+            thresholds[self.threshold_region_ignore] = thresholds.get(self.threshold_region_ignore, 0) + 1
+
+            # Move the hot zone to cover the recent regions, see _read_hot_zone()
+            if self.region_box:
+                document_config: dict = self.config['documents'][self.document_type]
+                padding: float = document_config.get('hot_zone_padding', 0.02)
+                box: list[float] = [round(max(self.region_box[0] - padding, 0), 4),
+                                    round(max(self.region_box[1] - padding, 0), 4),
+                                    round(min(self.region_box[2] + padding, 1), 4),
+                                    round(min(self.region_box[3] + padding, 1), 4)]
+
+                boxes: list[list[float]] = self.config['statistics'][self.document_type].setdefault('hot_zone_boxes', [])
+                boxes.append(box)
+                del boxes[:-document_config.get('hot_zone_window', 50)]
+
+                outliers: int = int(len(boxes) * document_config.get('hot_zone_outliers', 0.1))
+                x0s, y0s, x1s, y1s = (sorted(side) for side in zip(*boxes))
+                self.config['statistics'][self.document_type]['hot_zone'] = [
+                    x0s[outliers], y0s[outliers], x1s[-1 - outliers], y1s[-1 - outliers]]
+
     @property
     def document_type(self) -> str:
         """
@@ -175,7 +1049,8 @@ class DocumentImage:
         if self._document_type:
             return self._document_type
 
-        self.mime_type = magic.from_file(self.filename, mime=True)
+        # libmagic doesn't look further than the first megabyte
+        self.mime_type = magic.from_buffer(self.data[:1024 * 1024], mime=True)
 
         for document, values in self.config['documents'].items():
 
@@ -205,21 +1080,185 @@ class DocumentImage:
         :rtype: str
         """
 
-        while self._name == "" and self.threshold_region_ignore >= self.config['documents'][self.document_type][
-            'threshold_region_ignore_min']:
-            name = self._read()
+        cache: typing.Optional[OCRCache] = None
+
+        # Pages we've read before don't need to be read again
+        if self._name == "" and self.threshold_region_ignore >= self.config['documents'][self.document_type][
+            'threshold_region_ignore_min']:
+            cache = get_ocr_cache(self.config)
+            if cache:
+                name, region, region_box, threshold = cache.get(self)
+                if name:
+                    self._name = name
+                    self.region = region
+                    self.region_box = region_box
+                    self._threshold_region_ignore = threshold
+                    self.logger.debug(f"{self.filename} is {name} from the OCR cache. Region: {region}")
+                    if 'statistics' in self.config:
+                        self.record_statistics()
+                    return self._name
+
+        if self._name == "" and self.threshold_region_ignore >= self.config['documents'][self.document_type][
+            'threshold_region_ignore_min']:
+            name = self._read_text_layer()
+
+            # Multi-page files are read a page at a time until one of them has the name
+            threshold: int = self.threshold_region_ignore
+            for page in ([] if name else self.pages()):
+                self._threshold_region_ignore = threshold
+                name = self._read_page()
+                if name:
+                    break
 
-            # If we still don't have a name, increase sensitivity and try again
             if name:
                 self._name = self.odoo_sequence + name
-            else:
-                self.threshold_region_ignore -= self.config['documents'][self.document_type][
-                    'threshold_region_ignore_decrement']
-                self.logger.debug(
-                    f"{self.filename} can not be parsed. Changing OCR sensitivity {self.threshold_region_ignore + self.config['documents'][self.document_type]['threshold_region_ignore_decrement']} -> {self.threshold_region_ignore}.")
+
+        if cache and self._name:
+            cache.put(self)
+
+        # The image is only needed while reading the name, don't hold on to it
+        self._image = None
+        self._regions = None
 
         return self._name
 
+    def read_name(self) -> str:
+        """
+        Reads the name like name, but if the file can't be read the error is logged and the document is left
+        unreadable instead, so it is mailed and moved like any other and one bad file doesn't stop the run.
+        :return: the document's title, or an empty string if it couldn't be read
+        :rtype: str
+        """
+
+        try:
+            return self.name
+        except Exception as e:
+            self.logger.exception(f"Unable to read document name from {self.filename}: {e}")
+
+        self._name = ""
+        self._image = None
+        self._regions = None
+        self.unreadable = True
+        return ""
+
+    @property
+    def unreadable(self) -> bool:
+        """
+        Whether the name has been looked for and not found. The threshold is then below the document type's minimum,
+        so the file isn't read again.
+        :return: True if the document couldn't be read
+        :rtype: bool
+        """
+
+        return bool(self._document_type) and not self._name and self._threshold_region_ignore < self.config[
+            'documents'][self._document_type]['threshold_region_ignore_min']
+
+    @unreadable.setter
+    def unreadable(self, unreadable: bool) -> None:
+        """
+        Marks the document as read without finding its name, e.g. when resuming from the journal
+        :param unreadable:
+        :type unreadable: bool
+        :return: None
+        :rtype: None
+        """
+
+        if unreadable and self._document_type:
+            self._threshold_region_ignore = self.config['documents'][self._document_type][
+                                                'threshold_region_ignore_min'] - 1
+
+    def _read_page(self) -> str:
+        """
+        Reads the name from the current page, trying a barcode and the hot zone before sweeping the thresholds
+        :return: the document string, or an empty string if it wasn't found
+        :rtype: str
+        """
+
+        name: str = self._read_barcode() or self._read_hot_zone()
+        if name:
+            return name
+
+        for threshold in self._thresholds():
+            self.threshold_region_ignore = threshold
+            name = self._read()
+
+            if name:
+                return name
+
+            # If we still don't have a name, increase sensitivity and try again
+            self.logger.debug(f"{self.filename} page {self.page} can not be parsed at OCR sensitivity {threshold}.")
+
+        # Like the end of a full sweep, leave the threshold below the minimum so the image isn't read again
+        self._threshold_region_ignore = self.config['documents'][self.document_type]['threshold_region_ignore_min'] - 1
+        return ""
+
+    @property
+    def page_count(self) -> int:
+        """
+        The number of pages in the file, more than one for multi-page PDFs and TIFFs
+        :return: number of pages
+        :rtype: int
+        """
+
+        if not self._page_count:
+            if self.mime_type == PDF_MIME_TYPE:
+                if pypdf is not None:
+                    self._page_count = len(pypdf.PdfReader(io.BytesIO(self.data)).pages)
+                else:
+                    info: str = subprocess.run([self.config.get('pdfinfo-bin', 'pdfinfo'), '-'], input=self.data,
+                                               capture_output=True, check=True).stdout.decode(errors='replace')
+                    self._page_count = int(re.search(r'^Pages:\s+(\d+)', info, re.MULTILINE).group(1))
+            elif self.mime_type == TIFF_MIME_TYPE:
+                with Image.open(io.BytesIO(self.data)) as image:
+                    self._page_count = getattr(image, 'n_frames', 1)
+            else:
+                self._page_count = 1
+
+        return self._page_count
+
+    def pages(self) -> typing.Iterator[int]:
+        """
+        Steps through the pages of the file, setting page to each in turn. Each page is decoded when it is first
+        needed and released before the next one, so only one page is held in memory however long the file is.
+        :return: page numbers, starting at 1
+        :rtype: typing.Iterator[int]
+        """
+
+        for page in range(self.first_page, (self.last_page or self.page_count) + 1):
+            if page != self.page:
+                self._image = None
+                self._regions = None
+                self.page = page
+
+            yield page
+
+    def page_names(self) -> list[str]:
+        """
+        Reads the name of every page on its own, for splitting batch scans of many documents. Pages are read in
+        parallel on 'split-threads' threads (default the number of CPUs), and each page is decoded once however
+        many ways it is read.
+        :return: the name found on each page, an empty string for pages without one
+        :rtype: list[str]
+        """
+
+        # everything the readers share is worked out before they are copied
+        self.content_hash
+
+        readers: list[DocumentImage] = []
+        for page in range(1, self.page_count + 1):
+            # a copy shares the hash and page count, copying leaves out what __getstate__() does
+            reader = copy.copy(self)
+            reader.config = self.config
+            reader.logger = self.logger
+            reader._data = self.data
+            reader._name = ""
+            reader.page = reader.first_page = reader.last_page = page
+            readers.append(reader)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.config.get('split-threads', os.cpu_count() or 1),
+                                                   thread_name_prefix="split") as executor:
+            return list(executor.map(lambda reader: reader.name, readers))
+
     @name.setter
     def name(self, value: str) -> None:
         """
@@ -262,67 +1301,1032 @@ class DocumentImage:
         self._threshold_region_ignore = threshold_region_ignore
         self.reset()
 
-    def _mark_region(self):
+    def _read_text_layer(self) -> str:
+        """
+        Looks for the name in the text layer of a PDF, e.g. one printed from Odoo, so it doesn't need OCR at all. Pages
+        with fewer than text_layer_min_chars (default 20) characters of text, usually scans, are skipped. Needs the
+        pypdf module.
+        :return: the document string, or an empty string if this isn't a PDF or its text doesn't match
+        :rtype: str
+        """
+
+        if self.mime_type != PDF_MIME_TYPE or pypdf is None:
+            return ""
+
+        min_chars: int = self.config['documents'][self.document_type].get('text_layer_min_chars', 20)
+
+        try:
+            reader = pypdf.PdfReader(io.BytesIO(self.data))
+            for number in range(self.first_page, (self.last_page or len(reader.pages)) + 1):
+                t: str = (reader.pages[number - 1].extract_text() or "").replace('\n', ' ')
+                if len(t.strip()) < min_chars:
+                    continue
+
+                self.logger.debug(f'Reading {self.filename} text layer of page {number} result: {t}')
+                m: typing.Optional[re.Match] = self.regex.search(t)
+                if m:
+                    self.page = number
+                    return m.group(1)
+        except Exception as e:
+            self.logger.warning(f"Could not read the text layer of {self.filename}: {e}")
+
+        return ""
+
+    def _read_barcode(self) -> str:
+        """
+        Looks for the name in a barcode printed on the page, which is much faster and more reliable than OCR. Set up in
+        the document type as barcode: {symbology: qr, regex: ...}. The symbology is qr, a linear symbology known to
+        OpenCV such as code128 or ean13, or any; the regex defaults to ocr_regex. The page is shrunk to at most
+        barcode.max_pixels (default 2000000) pixels before decoding.
+        :return: the document string, or an empty string if there is no barcode set up or none matches
+        :rtype: str
+        """
+
+        barcode: typing.Optional[dict] = self.config['documents'][self.document_type].get('barcode')
+        if not barcode:
+            return ""
+
+        symbology: str = str(barcode.get('symbology', 'any')).replace('_', '').replace('-', '').lower()
+        regex: re.Pattern = re.compile(barcode['regex']) if barcode.get('regex') else self.regex
+
+        if self._image is None:
+            self._load_image()
+
+        image: np.ndarray = self._image
+        while image.size > barcode.get('max_pixels', 2_000_000):
+            image = cv2.pyrDown(image)
+
+        codes: list[tuple[str, str, np.ndarray]] = []
+        if symbology in ('qr', 'any'):
+            found, texts, points, _ = cv2.QRCodeDetector().detectAndDecodeMulti(image)
+            if found:
+                codes.extend(('qr', text, corners) for text, corners in zip(texts, points))
+        if symbology != 'qr':
+            found, texts, types, points = cv2.barcode.BarcodeDetector().detectAndDecodeWithType(image)
+            if found:
+                codes.extend((kind.replace('_', '').lower(), text, corners) for kind, text, corners in
+                             zip(types, texts, points))
+
+        for kind, text, corners in codes:
+            self.logger.debug(f'Reading {self.filename} {kind} barcode result: {text}')
+            if not text or symbology not in ('any', kind):
+                continue
+            m: typing.Optional[re.Match] = regex.search(text)
+            if m:
+                # The corners are in the shrunk image's pixels
+                scale: float = self._image.shape[1] / image.shape[1]
+                x, y, w, h = cv2.boundingRect(np.asarray(corners, np.float32) * scale)
+                self._record_hit((x, y, x + w, y + h))
+                return m.group(1)
+
+        return ""
+
+    def _read_hot_zone(self) -> str:
+        """
+        Reads the document type's hot zone, the part of the page its names are usually found in, straight from the
+        decoded image without looking for regions first. The zone is either set as hot_zone: [x0, y0, x1, y1] in
+        fractions of the page's width and height, or, with hot_zone: true, learned with --stats from the regions
+        names have been found in.
+        :return: the document string, or an empty string if the hot zone is not set or doesn't match
+        :rtype: str
+        """
+
+        zone = self.config['documents'][self.document_type].get('hot_zone')
+        if zone is True:
+            zone = (self.config.get('statistics', {}).get(self.document_type) or {}).get('hot_zone')
+        if not zone:
+            return ""
+
+        if self._image is None:
+            self._load_image()
+
+        height, width = self._image.shape[:2]
+        x0, y0, x1, y1 = int(zone[0] * width), int(zone[1] * height), int(zone[2] * width), int(zone[3] * height)
+
+        # The words' boxes show where in the zone the name is, for the statistics
+        crop: np.ndarray = self._crop(self._image, [(x0, y0), (x1, y1)])
+        words: list[tuple[int, int, int, int, int, str]] = self.ocr_engine.image_to_data(self._binarize(crop))
+        t: str = ' '.join(word[5] for word in words)
+        self.logger.debug(f'Reading {self.filename} hot zone: {zone} result: {t}')
+
+        m: typing.Optional[re.Match] = self.regex.search(t)
+        if not m:
+            return ""
+
+        # Crops of PDFs may have been rendered again at a higher resolution, see _crop()
+        scale: float = (x1 - x0) / crop.shape[1] if crop.shape[1] else 1
+        boxes: list[tuple[int, int, int, int]] = []
+        start: int = 0
+        for _, left, top, w, h, text in words:
+            if start < m.end(1) and start + len(text) > m.start(1):
+                boxes.append((left, top, left + w, top + h))
+            start += len(text) + 1
+        if boxes:
+            self._record_hit((x0 + int(min(box[0] for box in boxes) * scale),
+                              y0 + int(min(box[1] for box in boxes) * scale),
+                              x0 + int(max(box[2] for box in boxes) * scale),
+                              y0 + int(max(box[3] for box in boxes) * scale)))
+
+        return m.group(1)
+
+    def _record_hit(self, box: tuple[int, int, int, int]) -> None:
+        """
+        Records a name found without sweeping the regions, by a barcode or in the hot zone, in the statistics like
+        _read() does. The region is the one at the current threshold that the name is in, and its box is the one the
+        hot zone learns from, or the name's own box if it isn't in one.
+        :param box: where the name was found, x0, y0, x1, y1 in image pixels
+        :type box: tuple[int, int, int, int]
+        :return: None
+        :rtype: None
+        """
+
+        if 'statistics' not in self.config:
+            return
+
+        image, line_items_coordinates = self._mark_region()
+        height, width = image.shape[:2]
+        x: float = (box[0] + box[2]) / 2
+        y: float = (box[1] + box[3]) / 2
+
+        self.region = 0
+        for index, c in enumerate(line_items_coordinates):
+            if c[0][0] <= x <= c[1][0] and c[0][1] <= y <= c[1][1]:
+                self.region = len(line_items_coordinates) - index
+                box = (c[0][0], c[0][1], c[1][0], c[1][1])
+                break
+
+        self.region_box = [box[0] / width, box[1] / height, box[2] / width, box[3] / height]
+        self.record_statistics()
+
+    def _load_image(self) -> None:
+        """
+        Decodes the image file straight to grayscale, which is all OCR needs. With decode_scale (2, 4 or 8) set for the
+        document type, the image is decoded at that fraction of its size, which for JPEGs is done while decoding and
+        is much cheaper than a full decode. That suits scans with more resolution than OCR needs, e.g. 600 DPI.
+        PDFs are rendered a page at a time with pdftoppm and multi-page TIFFs decoded a page at a time.
+        :return: None
+        :rtype: None
+        """
+
+        if self.mime_type == PDF_MIME_TYPE:
+            dpi: int = self.config.get('pdf-dpi', 350) // self._decode_scale
+            self._image = render_pdf_page(self.filename, self.page, dpi, self.config.get('pdftoppm-bin', 'pdftoppm'),
+                                          data=self.data)
+            return
+
+        if self.page_count > 1:
+            # only the page being read is decoded, reduced decodes aren't available for multi-page files
+            found, images = cv2.imdecodemulti(np.frombuffer(self.data, np.uint8), cv2.IMREAD_GRAYSCALE,
+                                              range=(self.page - 1, self.page))
+            self._image = images[0] if found and images else None
+            if self._image is not None and self._decode_scale > 1:
+                self._image = cv2.resize(self._image, None, fx=1 / self._decode_scale, fy=1 / self._decode_scale,
+                                         interpolation=cv2.INTER_AREA)
+        else:
+            self._image = cv2.imdecode(np.frombuffer(self.data, np.uint8), self._IMREAD_FLAGS[self._decode_scale])
+
+        if self._image is None:
+            raise ValueError(f"{self.filename} could not be decoded as an image")
+
+    # cv2.imdecode() flags for each decode_scale
+    _IMREAD_FLAGS: dict[int, int] = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                                     4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+    @property
+    def _decode_scale(self) -> int:
         """
-        This method finds and defines regions in the image file using opencv2. Once the regions are identified, we can
-        feed them to tesseract for OCR.
+        How many times smaller than the file the decoded image is. PDFs are rendered at 'pdf-dpi' divided by this, or
+        with 'pdf-detection-dpi' set, at that resolution for finding regions while the crops that are read are
+        rendered again at 'pdf-dpi', see _crop(). get_configuration() makes sure 'pdf-dpi' is a multiple of it.
+        :return: 1, 2, 4 or 8
+        :rtype: int
+        """
+
+        if self.mime_type == PDF_MIME_TYPE and self.config.get('pdf-detection-dpi'):
+            return max(self.config.get('pdf-dpi', 350) // self.config['pdf-detection-dpi'], 1)
+
+        return self.config['documents'][self.document_type].get('decode_scale', 1)
+
+    def _crop(self, image: np.ndarray, c: list[tuple[int, int]]) -> np.ndarray:
+        """
+        The part of the image that is to be read. For PDFs found at 'pdf-detection-dpi', the crop is rendered again
+        at 'pdf-dpi' so OCR gets the full resolution without the whole page ever being rendered at it.
+        :param image: decoded image
+        :type image: np.ndarray
+        :param c: the top left and bottom right corners of the crop in image pixels
+        :type c: list[tuple[int, int]]
+        :return: the crop
+        :rtype: np.ndarray
+        """
+
+        if self.mime_type == PDF_MIME_TYPE and self.config.get('pdf-detection-dpi') and self._decode_scale > 1:
+            scale: int = self._decode_scale
+            return render_pdf_page(self.filename, self.page, self.config.get('pdf-dpi', 350),
+                                   self.config.get('pdftoppm-bin', 'pdftoppm'),
+                                   (c[0][0] * scale, c[0][1] * scale, c[1][0] * scale, c[1][1] * scale), self.data)
+
+        # cropping image img = image[y0:y1, x0:x1]
+        return image[c[0][1]:c[1][1], c[0][0]:c[1][0]]
+
+    def _find_regions(self) -> None:
+        """
+        This method finds the bounding rectangles of all text regions in the image using opencv2. None of this depends
+        on threshold_region_ignore, so it runs once per document and _mark_region() only filters the result.
+
+        With detection_max_pixels set for the document type, regions are found on a copy of the page halved in size
+        until it has no more pixels than that, with kernels scaled down to match. The rectangles are kept in the
+        file's full size pixels, so threshold_region_ignore means the same no matter what size the regions were found
+        or decoded at.
 
         :return: None
         :rtype: None
         """
 
-        image = cv2.imread(self.filename)
+        if self._image is None:
+            self._load_image()
+
+        gray = self._image
+
+        max_pixels: int = self.config['documents'][self.document_type].get('detection_max_pixels', 0)
+        scale: int = self._decode_scale
+        shrunk: bool = False
+        while max_pixels and gray.shape[0] * gray.shape[1] > max_pixels and min(gray.shape[:2]) > 1:
+            gray = cv2.pyrDown(gray)
+            scale *= 2
+            shrunk = True
 
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Kernel sizes that work at full size, shrunk with the image. Kernel sizes must be odd.
+        block_size: int = max(11 // scale, 3) | 1
+        dilate_size: int = -(-9 // scale)
+        blur_size: int = (9 // scale) | 1
 
-        blur = cv2.GaussianBlur(gray, (9, 9), 0)
-        thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 30)
+        # pyrDown blurs as it shrinks, blurring again would wash out thin text. Reduced decodes don't, so they are
+        # blurred like the full size image, with a smaller kernel.
+        blur = gray if shrunk else cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+        thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, block_size, 30)
 
         # Dilate to combine adjacent text contours
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (dilate_size, dilate_size))
         dilate = cv2.dilate(thresh, kernel, iterations=4)
 
-        # Find contours, highlight text areas, and extract ROIs
+        # Find contours and keep their bounding rectangles as rows of x, y, w, h, at full size
         cnts = cv2.findContours(dilate, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         cnts = cnts[0] if len(cnts) == 2 else cnts[1]
 
-        line_items_coordinates: list[list[tuple[Any, Any]]] = []
-        for c in cnts:
-            area = cv2.contourArea(c)
-            x, y, w, h = cv2.boundingRect(c)
+        self._regions = np.array([cv2.boundingRect(c) for c in cnts], dtype=np.int32).reshape(-1, 4) * scale
 
-            if w < self.threshold_region_ignore or h < self.threshold_region_ignore:
-                continue
+        if scale > 1:
+            self.logger.debug(f"Found {len(self._regions)} regions in {self.filename} at 1/{scale} size")
+
+    def _mark_region(self):
+        """
+        This method defines regions in the image file that are at least threshold_region_ignore wide and high. Once the
+        regions are identified, we can feed them to tesseract for OCR. Nothing is drawn on the image, set
+        debug-image-path to get a copy with the regions marked.
+
+        :return: the grayscale image and the coordinates of its regions
+        :rtype: tuple
+        """
 
-            image = cv2.rectangle(image, (x, y), (x + w, y + h), color=(255, 0, 255), thickness=3)
+        if self._regions is None:
+            self._find_regions()
+
+        keep: np.ndarray = (self._regions[:, 2] >= self.threshold_region_ignore) & (
+                self._regions[:, 3] >= self.threshold_region_ignore)
+
+        line_items_coordinates: list[list[tuple[Any, Any]]] = []
+        for x, y, w, h in (self._regions[keep] // self._decode_scale).tolist():
             line_items_coordinates.append([(x, y), (x + w, y + h)])
 
-        return image, line_items_coordinates
+        if self.config.get('debug-image-path'):
+            self._save_debug_image(line_items_coordinates)
+
+        return self._image, line_items_coordinates
+
+    def _save_debug_image(self, line_items_coordinates: list[list[tuple[Any, Any]]]) -> None:
+        """
+        Saves a colour copy of the image with the regions highlighted to debug-image-path
+        :param line_items_coordinates: the regions
+        :type line_items_coordinates: list[list[tuple[Any, Any]]]
+        :return: None
+        :rtype: None
+        """
+
+        image = cv2.cvtColor(self._image, cv2.COLOR_GRAY2BGR)
+        for c in line_items_coordinates:
+            cv2.rectangle(image, c[0], c[1], color=(255, 0, 255), thickness=3)
+
+        debug_file: Path = Path(self.config['debug-image-path']).joinpath(
+            f"{self.file.stem}{f'-p{self.page}' if self.page > 1 else ''}-{self.threshold_region_ignore}.png")
+        debug_file.parent.mkdir(exist_ok=True, parents=True)
+        cv2.imwrite(str(debug_file), image)
+        self.logger.debug(f"Saved regions of {self.filename} to {debug_file}")
+
+    @property
+    def ocr_engine(self) -> OCREngine:
+        """
+        The OCR engine from the configuration, shared by all documents in this process
+        :return: OCR engine
+        :rtype: OCREngine
+        """
+        return get_ocr_engine(self.config)
 
     def _read_text(self, image, line_items_coordinates, index) -> str:
         # get co-ordinates to crop the image
         c = line_items_coordinates[index]
 
-        # cropping image img = image[y0:y1, x0:x1]
-        img = image[c[0][1]:c[1][1], c[0][0]:c[1][0]]
+        return self._ocr(self._crop(image, c))
+
+    def _ocr(self, img) -> str:
+        # OCR the crop to get results
+        text = self.ocr_engine.image_to_string(self._binarize(img))
+        return text
 
+    @staticmethod
+    def _binarize(img: np.ndarray) -> np.ndarray:
         # convert the image to black and white for better OCR
         ret, thresh1 = cv2.threshold(img, 120, 255, cv2.THRESH_BINARY)
+        return thresh1
 
-        # pytesseract image to string to get results
-        text = str(pytesseract.image_to_string(thresh1, config='--psm 6'))
-        return text
+
+class Journal:
+
+    def __init__(self, config: dict) -> None:
+        """
+        A durable record of how far each file got through the Pipeline, kept in the SQLite file 'journal-file' and
+        keyed by the file's content hash. After a crash or restart, a file picks up after the last stage it
+        completed, so it is neither read again nor uploaded to Odoo twice. Entries older than
+        'journal-retention-days' are removed.
+
+        :param config: configuration data from the YAML config file returned by get_configuration()
+        :type config: dict
+        """
+
+        self.config: dict = config
+        self.logger: logging.Logger = config['logger']
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(config['journal-file'], check_same_thread=False, timeout=30)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS journal ("
+                             "hash TEXT PRIMARY KEY, file TEXT, document_type TEXT, name TEXT, odoo_id INTEGER, "
+                             "attachment_id INTEGER, document_id INTEGER, emailed INTEGER, moved INTEGER, "
+                             "updated REAL, unreadable INTEGER DEFAULT 0)")
+            # Journals made before unreadable files were recorded
+            if 'unreadable' not in [column[1] for column in self._db.execute("PRAGMA table_info(journal)")]:
+                self._db.execute("ALTER TABLE journal ADD COLUMN unreadable INTEGER DEFAULT 0")
+            self._db.execute("DELETE FROM journal WHERE updated < ?",
+                             (time() - config.get('journal-retention-days', 30) * 86400,))
+
+    def resume(self, document: DocumentImage) -> bool:
+        """
+        Restores the stages a document has already completed
+        :param document:
+        :type document: DocumentImage
+        :return: True if the document was in the journal
+        :rtype: bool
+        """
+
+        with self._lock:
+            row = self._db.execute("SELECT document_type, name, odoo_id, attachment_id, document_id, emailed, moved, "
+                                   "unreadable FROM journal WHERE hash = ?", (document.content_hash,)).fetchone()
+        if not row:
+            return False
+
+        document_type, name, odoo_id, attachment_id, document_id, emailed, moved, unreadable = row
+
+        # Only restore what was done for the same kind of document
+        if document_type != document.document_type:
+            return False
+
+        document._name = document._name or name
+        document.odoo_id = document.odoo_id or odoo_id
+        document.odoo_attachment_id = document.odoo_attachment_id or attachment_id
+        document.odoo_document_id = document.odoo_document_id or document_id
+        document.is_emailed = document.is_emailed or bool(emailed)
+        # A file that was read without finding its name goes straight on to be mailed and moved
+        if unreadable and not document._name:
+            document.unreadable = True
+
+        self.logger.info(f"Resuming {document.filename} as {name or ('unreadable' if unreadable else 'unread')} id: {odoo_id} aid: {attachment_id} "
+                         f"document: {document_id} emailed: {bool(emailed)} moved: {bool(moved)}")
+        return True
+
+    def record(self, document: DocumentImage, moved: bool = False) -> None:
+        """
+        Records the stages a document has completed so far
+        :param document:
+        :type document: DocumentImage
+        :param moved: the file has been moved to the done directory
+        :type moved: bool
+        :return: None
+        :rtype: None
+        """
+
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO journal (hash, file, document_type, name, odoo_id, attachment_id, "
+                             "document_id, emailed, moved, updated, unreadable) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (document.content_hash, document.filename, document.document_type, document._name,
+                              document.odoo_id, document.odoo_attachment_id, document.odoo_document_id,
+                              document.is_emailed, moved, time(), document.unreadable))
+
+    def close(self) -> None:
+        """
+        Closes the journal file
+        :return: None
+        :rtype: None
+        """
+
+        self._db.close()
+
+
+class Base64Stream:
+
+    def __init__(self, data: typing.Union[bytes, mmap.mmap]) -> None:
+        """
+        Binary data to send to Odoo base64 encoded, e.g. an attachment's datas, without encoding it all up front.
+        xmlrpc_request() leaves a placeholder in the request for it and the encoding happens while the request is
+        being sent, see StreamingBody.
+
+        :param data: the data, e.g. DocumentImage.data
+        :type data: bytes or mmap.mmap
+        """
+
+        self.data: typing.Union[bytes, mmap.mmap] = data
+        self.token: str = uuid.uuid4().hex
+
+
+class _StreamingMarshaller(xmlrpc.client.Marshaller):
+    """
+    Marshals Base64Stream values as placeholders and keeps track of them
+    """
+
+    dispatch: dict = dict(xmlrpc.client.Marshaller.dispatch)
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.streams: dict[bytes, Base64Stream] = {}
+
+    def dump_base64_stream(self, value: Base64Stream, write: typing.Callable) -> None:
+        self.streams[value.token.encode('ascii')] = value
+        write("<value><string>")
+        write(value.token)
+        write("</string></value>\n")
+
+    dispatch[Base64Stream] = dump_base64_stream
+
+
+class StreamingBody:
+
+    # Encode 192 KiB at a time, a multiple of 3 so the chunks join up without padding
+    chunk_size: int = 3 * 64 * 1024
+
+    def __init__(self, request: bytes, streams: dict) -> None:
+        """
+        An XML-RPC request body that base64 encodes its Base64Streams a chunk at a time as it is sent, so sending a
+        file takes a constant amount of memory however big the file is. http.client sends any body with a length
+        that can be iterated, and iterating again starts over, so xmlrpc.client.Transport can retry it.
+
+        :param request: the request with placeholders for the streams
+        :type request: bytes
+        :param streams: the streams by their placeholder
+        :type streams: dict[bytes, Base64Stream]
+        """
+
+        self.parts: list[typing.Union[bytes, Base64Stream]] = []
+        for part in re.split(b'(' + b'|'.join(re.escape(token) for token in streams) + b')', request):
+            self.parts.append(streams.get(part, part))
+
+    def __len__(self) -> int:
+        return sum(-(-len(part.data) // 3) * 4 if isinstance(part, Base64Stream) else len(part) for part in self.parts)
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        for part in self.parts:
+            if not isinstance(part, Base64Stream):
+                yield part
+                continue
+
+            data: memoryview = memoryview(part.data)
+            for start in range(0, len(data), self.chunk_size):
+                yield base64.b64encode(data[start:start + self.chunk_size])
+
+
+def xmlrpc_request(method: str, params: tuple) -> typing.Union[bytes, StreamingBody]:
+    """
+    Marshals an XML-RPC call like xmlrpc.client.dumps() does, but Base64Stream parameters are left to be encoded
+    while the request is being sent
+
+    :param method: the method to call, e.g. execute_kw
+    :type method: str
+    :param params: its parameters
+    :type params: tuple
+    :return: the request body
+    :rtype: bytes or StreamingBody
+    """
+
+    marshaller = _StreamingMarshaller('utf-8', allow_none=True)
+    request: bytes = (f"<?xml version='1.0'?>\n<methodCall>\n<methodName>{method}</methodName>\n"
+                      f"{marshaller.dumps(params)}</methodCall>\n").encode('utf-8', 'xmlcharrefreplace')
+
+    return StreamingBody(request, marshaller.streams) if marshaller.streams else request
+
+
+# JSON-RPC request ids, see jsonrpc_request()
+_jsonrpc_ids: typing.Iterator[int] = itertools.count(1)
+
+
+def jsonrpc_request(service: str, method: str, args: tuple) -> typing.Union[bytes, StreamingBody]:
+    """
+    Makes the body of a call to one of Odoo's services, e.g. object.execute_kw, over its /jsonrpc endpoint.
+    Base64Stream parameters are left to be encoded while the request is being sent, as with xmlrpc_request().
+
+    :param service: the service, common or object
+    :type service: str
+    :param method: the service's method, e.g. execute_kw
+    :type method: str
+    :param args: its arguments
+    :type args: tuple
+    :return: the request body
+    :rtype: bytes or StreamingBody
+    """
+
+    streams: dict[bytes, Base64Stream] = {}
+
+    def placeholder(value: Any) -> str:
+        if isinstance(value, Base64Stream):
+            streams[value.token.encode('ascii')] = value
+            return value.token
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    request: bytes = json.dumps({'jsonrpc': '2.0', 'method': 'call', 'id': next(_jsonrpc_ids),
+                                 'params': {'service': service, 'method': method, 'args': list(args)}},
+                                default=placeholder).encode('utf-8')
+
+    return StreamingBody(request, streams) if streams else request
+
+
+class _GzipStreamingMixin:
+    """
+    Gzips StreamingBody requests over encode_threshold bytes, which xmlrpc.client only does for bytes. The body is
+    compressed into a temporary file that only goes to disk when it gets big, so the length is known before sending.
+    """
+
+    def send_content(self, connection, request_body) -> None:
+        if not isinstance(request_body, StreamingBody) or self.encode_threshold is None or len(
+                request_body) <= self.encode_threshold:
+            return super().send_content(connection, request_body)
+
+        connection.putheader("Content-Encoding", "gzip")
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as body:
+            with gzip.GzipFile(fileobj=body, mode='wb', compresslevel=1) as compressed:
+                for chunk in request_body:
+                    compressed.write(chunk)
+
+            connection.putheader("Content-Length", str(body.tell()))
+            body.seek(0)
+            connection.endheaders(body)
+
+
+class _JSONRPCMixin:
+    """
+    Speaks JSON-RPC instead of XML-RPC over an xmlrpc.client transport, keeping its keep-alive connection, retry and
+    gzip handling. Errors are raised as xmlrpc.client.Fault so callers don't need to know which protocol is in use.
+    """
+
+    def send_headers(self, connection, headers: list) -> None:
+        super().send_headers(connection, [(key, 'application/json' if key == 'Content-Type' else value)
+                                          for key, value in headers])
+
+    def parse_response(self, response) -> tuple:
+        stream = response
+        if response.getheader("Content-Encoding", "") == "gzip":
+            stream = xmlrpc.client.GzipDecodedResponse(response)
+
+        reply: dict = json.loads(stream.read())
+        if stream is not response:
+            stream.close()
+
+        error: typing.Optional[dict] = reply.get('error')
+        if error:
+            raise xmlrpc.client.Fault(error.get('code', 0),
+                                      (error.get('data') or {}).get('message') or error.get('message', ''))
+
+        return reply.get('result'),
+
+
+class _Transport(_GzipStreamingMixin, xmlrpc.client.Transport):
+    pass
+
+
+class _SafeTransport(_GzipStreamingMixin, xmlrpc.client.SafeTransport):
+    pass
+
+
+class _JSONRPCTransport(_JSONRPCMixin, _Transport):
+    pass
+
+
+class _SafeJSONRPCTransport(_JSONRPCMixin, _SafeTransport):
+    pass
+
+
+class ConnectionPool:
+
+    def __init__(self, url: str, size: int = 4, verbose: bool = False, idle_timeout: float = 60,
+                 json_rpc: bool = False, gzip_threshold: typing.Optional[int] = None) -> None:
+        """
+        A pool of persistent HTTP/1.1 keep-alive connections to one XML-RPC or JSON-RPC endpoint. Each connection is
+        used by one thread at a time, so the pool can be shared by upload threads.
+
+        :param url: the endpoint, e.g. https://odoo.example.com/xmlrpc/2/object
+        :type url: str
+        :param size: the number of idle connections to keep
+        :type size: int
+        :param verbose: log the XML-RPC conversation
+        :type verbose: bool
+        :param idle_timeout: seconds after which an idle connection is not trusted any more and is replaced
+        :type idle_timeout: float
+        :param json_rpc: the endpoint speaks JSON-RPC, requests come from jsonrpc_request()
+        :type json_rpc: bool
+        :param gzip_threshold: gzip requests bigger than this many bytes, None to never compress them
+        :type gzip_threshold: int
+        """
+
+        self.url: str = url
+        self.verbose: bool = verbose
+        self.idle_timeout: float = idle_timeout
+        self.json_rpc: bool = json_rpc
+        self.gzip_threshold: typing.Optional[int] = gzip_threshold
+        self._context: ssl.SSLContext = ssl._create_unverified_context()
+
+        parts: urllib.parse.SplitResult = urllib.parse.urlsplit(url)
+        self._host: str = parts.netloc
+        self._handler: str = parts.path or "/RPC2"
+
+        # Idle transports and the time they were last used, most recently used first
+        self._idle: queue.LifoQueue = queue.LifoQueue(size)
+
+    def _transport(self) -> xmlrpc.client.Transport:
+        """
+        Takes an idle transport from the pool or makes a new one
+        :return: a transport that may or may not have an open connection
+        :rtype: xmlrpc.client.Transport
+        """
+
+        while True:
+            try:
+                transport, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            if monotonic() - last_used < self.idle_timeout:
+                return transport
+
+            # The server has most likely closed this one already
+            transport.close()
+
+        transport: xmlrpc.client.Transport
+        if self.url.startswith('https'):
+            transport = (_SafeJSONRPCTransport if self.json_rpc else _SafeTransport)(context=self._context)
+        else:
+            transport = (_JSONRPCTransport if self.json_rpc else _Transport)()
+
+        # Responses are always accepted gzipped, compressing requests needs the server (or its proxy) to allow it
+        transport.encode_threshold = self.gzip_threshold
+
+        return transport
+
+    def request(self, body: typing.Union[bytes, StreamingBody]) -> Any:
+        """
+        Sends a request made by xmlrpc_request(), or jsonrpc_request() for JSON-RPC, over a pooled connection
+        :param body: the request body
+        :type body: bytes or StreamingBody
+        :return: the result of the call
+        :rtype: Any
+        """
+
+        with self._lend() as transport:
+            response: tuple = transport.request(self._host, self._handler, body, verbose=self.verbose)
+
+        return response[0] if len(response) == 1 else response
+
+    @contextlib.contextmanager
+    def _lend(self) -> typing.Generator[xmlrpc.client.Transport, None, None]:
+        """
+        Lends out a pooled transport. It goes back to the pool when the block finishes, unless it raised something other
+        than a fault and the connection can't be trusted. Connections the server has dropped while idle are reconnected
+        by the transport.
+        :return: transport
+        :rtype: xmlrpc.client.Transport
+        """
+
+        transport: xmlrpc.client.Transport = self._transport()
+
+        try:
+            yield transport
+
+        except xmlrpc.client.Fault:
+            self._release(transport)
+            raise
+
+        except BaseException:
+            transport.close()
+            raise
+
+        self._release(transport)
+
+    def _release(self, transport: xmlrpc.client.Transport) -> None:
+        """
+        Returns a transport to the pool, or closes it if the pool is full
+        :param transport:
+        :type transport: xmlrpc.client.Transport
+        :return: None
+        :rtype: None
+        """
+
+        try:
+            self._idle.put_nowait((transport, monotonic()))
+        except queue.Full:
+            transport.close()
+
+    def close(self) -> None:
+        """
+        Closes all idle connections
+        :return: None
+        :rtype: None
+        """
+
+        while True:
+            try:
+                transport, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            transport.close()
+
+
+class OdooIndex:
+
+    def __init__(self, config: dict, connector: "OdooConnector") -> None:
+        """
+        A local copy of the name -> id mapping of the Odoo models documents are attached to, kept in the SQLite file
+        'odoo-index-file'. Each model is loaded in bulk the first time and then kept up to date with the records
+        written in Odoo since the last sync. Since the file belongs to one Odoo database, put it in the servers section.
+
+        :param config: configuration data from the YAML config file returned by get_configuration()
+        :type config: dict
+        :param connector: used to read the records from Odoo
+        :type connector: OdooConnector
+        """
+
+        self.config: dict = config
+        self.logger: logging.Logger = config['logger']
+        self.connector: OdooConnector = connector
+        self.sync_interval: float = config.get('odoo-index-sync-interval', 300)
+        self.page_size: int = config.get('odoo-index-page-size', 5000)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(config['odoo-index-file'], check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS records ("
+                             "model TEXT, name TEXT, id INTEGER, PRIMARY KEY (model, name))")
+            self._db.execute("CREATE INDEX IF NOT EXISTS records_id ON records (model, id)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sync (model TEXT PRIMARY KEY, write_date TEXT)")
+
+        # model -> name -> id, so lookups don't touch the database
+        self._ids: dict[str, dict[str, int]] = {}
+        for model, name, odoo_id in self._db.execute("SELECT model, name, id FROM records"):
+            self._ids.setdefault(model, {})[name] = odoo_id
+
+        # model -> time of the last sync in this process
+        self._synced: dict[str, float] = {}
+
+    def get(self, model: str, name: str) -> int:
+        """
+        Looks up a name in the index, syncing the model first if it is due
+        :param model: Odoo model, e.g. account.move
+        :type model: str
+        :param name: record name
+        :type name: str
+        :return: the record's ID, 0 if it is not in the index
+        :rtype: int
+        """
+
+        with self._lock:
+            if time() - self._synced.get(model, 0) > self.sync_interval:
+                try:
+                    self._sync(model)
+                except Exception as e:
+                    # Don't hold up every lookup while Odoo is unreachable, try again after the interval
+                    self._synced[model] = time()
+                    self.logger.warning(f"Unable to sync the Odoo index for {model}: {e}")
+
+            return self._ids.get(model, {}).get(name, 0)
+
+    def add(self, model: str, name: str, odoo_id: int) -> None:
+        """
+        Adds a record found by a live search to the index
+        :param model: Odoo model, e.g. account.move
+        :type model: str
+        :param name: record name
+        :type name: str
+        :param odoo_id: record ID
+        :type odoo_id: int
+        :return: None
+        :rtype: None
+        """
+
+        with self._lock, self._db:
+            self._store(model, [{'id': odoo_id, 'name': name}])
+
+    def _sync(self, model: str) -> None:
+        """
+        Reads all records of the model written since the last sync, or all of them the first time. Records written
+        in the same second as the last sync are read again, so nothing falls between two syncs.
+        :param model: Odoo model, e.g. account.move
+        :type model: str
+        :return: None
+        :rtype: None
+        """
+
+        row = self._db.execute("SELECT write_date FROM sync WHERE model = ?", (model,)).fetchone()
+        last_write_date: str = row[0] if row else ""
+        domain: list = [['write_date', '>=', last_write_date]] if last_write_date else []
+
+        offset: int = 0
+        count: int = 0
+        while True:
+            records: typing.List[dict] = self.connector._execute_kw(
+                model, 'search_read', [domain],
+                {'fields': ['id', 'name', 'write_date'], 'order': 'write_date, id', 'offset': offset,
+                 'limit': self.page_size})
+
+            with self._db:
+                self._store(model, records)
+                if records:
+                    last_write_date = max(last_write_date, records[-1]['write_date'])
+                    self._db.execute("INSERT OR REPLACE INTO sync (model, write_date) VALUES (?, ?)",
+                                     (model, last_write_date))
+
+            count += len(records)
+            offset += len(records)
+            if len(records) < self.page_size:
+                break
+
+        self._synced[model] = time()
+        self.logger.debug(f"Synced {count} {model} records to the Odoo index. Last write date {last_write_date}")
+
+    def _store(self, model: str, records: typing.List[dict]) -> None:
+        """
+        Writes records to the index. A record that has been renamed (e.g. a draft that was posted) loses its old name.
+        :param model: Odoo model, e.g. account.move
+        :type model: str
+        :param records: dicts with id and name
+        :type records: list[dict]
+        :return: None
+        :rtype: None
+        """
+
+        ids: dict[str, int] = self._ids.setdefault(model, {})
+
+        for record in records:
+            for (name,) in self._db.execute("SELECT name FROM records WHERE model = ? AND id = ?",
+                                            (model, record['id'])).fetchall():
+                ids.pop(name, None)
+            self._db.execute("DELETE FROM records WHERE model = ? AND id = ?", (model, record['id']))
+
+            self._db.execute("INSERT OR REPLACE INTO records (model, name, id) VALUES (?, ?, ?)",
+                             (model, record['name'], record['id']))
+            ids[record['name']] = record['id']
+
+    def close(self) -> None:
+        """
+        Closes the index file
+        :return: None
+        :rtype: None
+        """
+
+        self._db.close()
+
+
+class OdooProtocol:
+
+    name: str = ""
+
+    def __init__(self, config: dict) -> None:
+        """
+        Base class for the ways OdooConnector talks to Odoo, chosen with 'odoo-protocol' in the server's
+        configuration. Requests over 'odoo-gzip-threshold' bytes are gzipped, for servers that accept that.
+
+        :param config: configuration from YAML file
+        :type config: dict
+        """
+
+        self.config: dict = config
+        self.url: str = config['url']
+
+    def _connection_pool(self, url: str, service: str, json_rpc: bool = False) -> ConnectionPool:
+        """
+        A connection pool for one of the server's services. With debug on, the common service's conversation is
+        logged, but not the object service's, which would print every attachment's contents.
+        :param url: the endpoint
+        :type url: str
+        :param service: common or object
+        :type service: str
+        :param json_rpc: whether it speaks JSON-RPC
+        :type json_rpc: bool
+        :return: connection pool
+        :rtype: ConnectionPool
+        """
+
+        return ConnectionPool(url, self.config.get('odoo-pool-size', 4), self.config['debug'] and service == 'common',
+                              self.config.get('odoo-pool-idle-timeout', 60), json_rpc,
+                              self.config.get('odoo-gzip-threshold'))
+
+    def call(self, service: str, method: str, args: tuple) -> Any:
+        """
+        Calls a method of one of Odoo's services
+        :param service: common or object
+        :type service: str
+        :param method: e.g. authenticate or execute_kw
+        :type method: str
+        :param args: the method's arguments
+        :type args: tuple
+        :return: whatever Odoo returns
+        :rtype: Any
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Closes the connections to Odoo
+        :return: None
+        :rtype: None
+        """
+        raise NotImplementedError
+
+
+class XMLRPCProtocol(OdooProtocol):
+    """
+    Odoo's /xmlrpc/2 endpoints, which every version of Odoo has
+    """
+
+    name = "xmlrpc"
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+
+        # Keep-alive connections for each XML-RPC endpoint, shared by all threads using this connector
+        self._pools: dict[str, ConnectionPool] = {
+            service: self._connection_pool(f"{self.url}/xmlrpc/2/{service}", service) for service in
+            ('common', 'object')}
+
+    def call(self, service: str, method: str, args: tuple) -> Any:
+        return self._pools[service].request(xmlrpc_request(method, args))
+
+    def close(self) -> None:
+        for pool in self._pools.values():
+            pool.close()
+
+
+class JSONRPCProtocol(OdooProtocol):
+    """
+    Odoo's /jsonrpc endpoint. JSON is quicker than XML to make and to parse on both ends, which shows most with the
+    base64 contents of attachments.
+    """
+
+    name = "jsonrpc"
+
+    def __init__(self, config: dict) -> None:
+        super().__init__(config)
+
+        # Both services share the endpoint, but have their own pools so only common is logged with debug on
+        self._pools: dict[str, ConnectionPool] = {
+            service: self._connection_pool(f"{self.url}/jsonrpc", service, json_rpc=True) for service in
+            ('common', 'object')}
+
+    def call(self, service: str, method: str, args: tuple) -> Any:
+        return self._pools[service].request(jsonrpc_request(service, method, args))
+
+    def close(self) -> None:
+        for pool in self._pools.values():
+            pool.close()
+
+
+ODOO_PROTOCOLS: dict = {protocol.name: protocol for protocol in (XMLRPCProtocol, JSONRPCProtocol)}
 
 
 class OdooConnector:
 
-    def __init__(self, configuration: dict) -> None:
+    def __init__(self, configuration: dict, journal: typing.Optional[Journal] = None) -> None:
         """
         Connection Handler to communicate with Odoo
         :param configuration:
         :type configuration:
+        :param journal: records each record created in Odoo as soon as it exists
+        :type journal: Journal
         """
         self.config: dict = configuration
+        self.journal: typing.Optional[Journal] = journal
         self.url: str = self.config['url']
         self.db: str = self.config['database']
         self.username: str = self.config['username']
@@ -331,6 +2335,17 @@ class OdooConnector:
 
         self._uid = 0
 
+        protocol: str = self.config.get('odoo-protocol', XMLRPCProtocol.name)
+        if protocol not in ODOO_PROTOCOLS:
+            raise ValueError(f"Unknown odoo-protocol {protocol}. Valid protocols: {', '.join(ODOO_PROTOCOLS)}")
+
+        # How we talk to Odoo, shared by all threads using this connector
+        self.protocol: OdooProtocol = ODOO_PROTOCOLS[protocol](self.config)
+
+        # Optional local name -> id index, see OdooIndex
+        self.index: typing.Optional[OdooIndex] = OdooIndex(configuration, self) if configuration.get(
+            'odoo-index-file') else None
+
     def _get_uid(self):
 
         try:
@@ -338,14 +2353,45 @@ class OdooConnector:
 
         except KeyError:
 
-            with xmlrpc.client.ServerProxy(f"{self.url}/xmlrpc/2/common", allow_none=True, verbose=self.config['debug'],
-                                           context=ssl._create_unverified_context()) as common:
-                self._uid = common.authenticate(self.db, self.username, self.password, {})
+            self._uid = self.protocol.call('common', 'authenticate', (self.db, self.username, self.password, {}))
 
-                self.config['uid'] = self._uid
+            self.config['uid'] = self._uid
 
         return self._uid
 
+    def _execute_kw(self, model: str, method: str, args: list, kwargs: typing.Optional[dict] = None) -> Any:
+        """
+        Calls a method of an Odoo model over a pooled connection
+        :param model: Odoo model, e.g. ir.attachment
+        :type model: str
+        :param method: the model's method, e.g. create
+        :type method: str
+        :param args: positional arguments for the method
+        :type args: list
+        :param kwargs: keyword arguments for the method
+        :type kwargs: dict
+        :return: whatever Odoo returns
+        :rtype: Any
+        """
+
+        uid: int = self.uid
+
+        # Base64Streams in the arguments, e.g. attachment contents, are encoded as the request is sent
+        return self.protocol.call('object', 'execute_kw', (self.db, uid, self.password, model, method, args,
+                                                           kwargs or {}))
+
+    def close(self) -> None:
+        """
+        Closes the connections to Odoo
+        :return: None
+        :rtype: None
+        """
+
+        self.protocol.close()
+
+        if self.index:
+            self.index.close()
+
     @property
     def uid(self) -> int:
         """
@@ -364,52 +2410,213 @@ class OdooConnector:
         :return:
         :rtype: None
         """
-        self._uid = user_id
+        self._uid = user_id
+
+    def odoo_document_id(self, document: DocumentImage) -> int:
+        """
+        Gets the documents Odoo ID by searching for the documents name in Odoo
+        :param document:
+        :type document: DocumentImage
+        :return: document's ID
+        :rtype: int
+        """
+        retry: int = 0
+        odoo_id: int = 0
+
+        # Try the local index before asking Odoo
+        if self.index and document.name:
+            model: str = self.config['documents'][document.document_type]['odoo_object']
+            odoo_id = self.index.get(model, document.name)
+            if odoo_id:
+                self.logger.debug(f'File: {document.filename} Name: {document.name} has an Odoo ID of {odoo_id}')
+                document.odoo_id = odoo_id
+                return odoo_id
+
+        while odoo_id == 0 and retry < self.config['retry']:
+
+            # If we do not have a document name, we can't search Odoo so bail out
+            if not document.name:
+                self.logger.warning(f"Unable to read document name from {document.filename}. SKIPPING")
+                return odoo_id
+            try:
+                res = self._execute_kw(self.config['documents'][document.document_type]['odoo_object'],
+                                       'search_read', [[['name', '=', document.name]]], {'fields': ['id', 'name']})
+                # If we get an id, set it in the document
+                if type(res) == list and res[0]['name'] == document.name:
+                    odoo_id = res[0]['id']
+                    self.logger.debug(
+                        f'File: {document.filename} Name: {document.name} has an Odoo ID of {odoo_id}')
+                    document.odoo_id = odoo_id
+                    if self.index:
+                        self.index.add(self.config['documents'][document.document_type]['odoo_object'],
+                                       document.name, odoo_id)
+                else:
+                    break
+            except Exception as e:
+                odoo_id = 0
+                retry += 1
+                self.logger.warning(e)
+                self.logger.exception(
+                    f"There was a problem getting the document id from Odoo. Retry {retry}/{self.config['retry']}")
+                sleep(self.config['retry_sleep'])
+
+        return odoo_id
+
+    def odoo_document_ids(self, documents: typing.List[DocumentImage]) -> typing.List[int]:
+        """
+        Gets the Odoo IDs of many documents at once, with one search_read per Odoo model instead of one per document
+        :param documents:
+        :type documents: list[DocumentImage]
+        :return: each document's ID, 0 if it was not found
+        :rtype: list[int]
+        """
+
+        # Group the names we still need by the model they live in
+        names_by_model: dict[str, set[str]] = {}
+        for document in documents:
+            if document.odoo_id:
+                continue
+            if not document.read_name():
+                self.logger.warning(f"Unable to read document name from {document.filename}. SKIPPING")
+                continue
+
+            model: str = self.config['documents'][document.document_type]['odoo_object']
+
+            # Try the local index before asking Odoo
+            if self.index:
+                document.odoo_id = self.index.get(model, document.name)
+                if document.odoo_id:
+                    self.logger.debug(
+                        f'File: {document.filename} Name: {document.name} has an Odoo ID of {document.odoo_id}')
+                    continue
+
+            names_by_model.setdefault(model, set()).add(document.name)
+
+        ids: dict[tuple[str, str], int] = {}
+        for model, names in names_by_model.items():
+            retry: int = 0
+            while retry < self.config['retry']:
+                try:
+                    res = self._execute_kw(model, 'search_read', [[['name', 'in', sorted(names)]]],
+                                           {'fields': ['id', 'name']})
+                    for record in res:
+                        ids.setdefault((model, record['name']), record['id'])
+                        if self.index:
+                            self.index.add(model, record['name'], record['id'])
+                    break
+                except Exception as e:
+                    retry += 1
+                    self.logger.warning(e)
+                    self.logger.exception(
+                        f"There was a problem getting the document ids from Odoo. Retry {retry}/{self.config['retry']}")
+                    sleep(self.config['retry_sleep'])
+
+        for document in documents:
+            if not document.odoo_id and document.name:
+                document.odoo_id = ids.get(
+                    (self.config['documents'][document.document_type]['odoo_object'], document.name), 0)
+                if document.odoo_id:
+                    self.logger.debug(
+                        f'File: {document.filename} Name: {document.name} has an Odoo ID of {document.odoo_id}')
+
+        return [document.odoo_id for document in documents]
+
+    def _journal(self, documents: typing.List[DocumentImage]) -> None:
+        """
+        Records the documents in the journal, if there is one
+        :param documents:
+        :type documents: list[DocumentImage]
+        :return: None
+        :rtype: None
+        """
+
+        if self.journal:
+            for document in documents:
+                self.journal.record(document)
+
+    def _attachment_values(self, document: DocumentImage) -> dict:
+        """
+        The values to create the document's ir.attachment with, including the file's contents
+        :param document:
+        :type document: DocumentImage
+        :return: ir.attachment values
+        :rtype: dict
+        """
 
-    def odoo_document_id(self, document: DocumentImage) -> int:
+        data, mime_type, file_name = document.upload
+        return {
+            'name': document.name.replace('/', '-') + '_' + file_name,
+            'res_id': document.odoo_id,
+            'res_model': self.config['documents'][document.document_type]['odoo_object'],
+            'attachment_tag_id': self.config['documents'][document.document_type]['odoo_attachment_tag_id'],
+            'mimetype': mime_type,
+            'datas': Base64Stream(data)}
+
+    def _document_values(self, document: DocumentImage) -> dict:
         """
-        Gets the documents Odoo ID by searching for the documents name in Odoo
+        The values to create the document's documents.document from its ir.attachment with
         :param document:
         :type document: DocumentImage
-        :return: document's ID
-        :rtype: int
+        :return: documents.document values
+        :rtype: dict
         """
-        retry: int = 0
-        odoo_id: int = 0
 
-        while odoo_id == 0 and retry < self.config['retry']:
+        return {
+            'attachment_id': document.odoo_attachment_id,
+            'folder_id': self.config['documents'][document.document_type]['odoo_folder_id'],
+            'active': True,
+        }
 
-            # If we do not have a document name, we can't search Odoo so bail out
-            if not document.name:
-                self.logger.warning(f"Unable to read document name from {document.filename}. SKIPPING")
-                return odoo_id
-            try:
-                with xmlrpc.client.ServerProxy(f'{self.url}/xmlrpc/2/object', allow_none=True,
-                                               context=ssl._create_unverified_context()) as models:
-                    res = models.execute_kw(self.db, self.uid, self.password,
-                                            self.config['documents'][document.document_type]['odoo_object'],
-                                            'search_read', [[['name', '=', document.name]]], {'fields': ['id', 'name']})
-                    # If we get an id, set it in the document
-                    if type(res) == list and res[0]['name'] == document.name:
-                        odoo_id = res[0]['id']
-                        self.logger.debug(
-                            f'File: {document.filename} Name: {document.name} has an Odoo ID of {odoo_id}')
-                        document.odoo_id = odoo_id
-                    else:
-                        break
-            except Exception as e:
-                odoo_id = 0
-                retry += 1
-                self.logger.warning(e)
-                self.logger.exception(
-                    f"There was a problem getting the document id from Odoo. Retry {retry}/{self.config['retry']}")
-                sleep(self.config['retry_sleep'])
+    def _existing_attachments(self, documents: typing.List[DocumentImage]) -> None:
+        """
+        Finds attachments that are already in Odoo for the documents, e.g. from a run that failed before the files
+        were moved to done, by the checksum Odoo keeps of each attachment's contents. Documents that have one get its
+        ID, and its documents.document's if it has one, so the file isn't sent or attached again.
+        :param documents: documents with an odoo_id but no odoo_attachment_id
+        :type documents: list[DocumentImage]
+        :return: None
+        :rtype: None
+        """
 
-        return odoo_id
+        models: dict[str, typing.List[DocumentImage]] = {}
+        for document in documents:
+            models.setdefault(self.config['documents'][document.document_type]['odoo_object'], []).append(document)
+
+        found: typing.List[DocumentImage] = []
+        for model, model_documents in models.items():
+            domain: list = [['res_model', '=', model],
+                            ['res_id', 'in', [document.odoo_id for document in model_documents]],
+                            ['checksum', 'in', [document.checksum for document in model_documents]]]
+            attachments: typing.List[dict] = self._execute_kw('ir.attachment', 'search_read', [domain],
+                                                              {'fields': ['id', 'res_id', 'checksum']})
+
+            attachment_ids: dict[tuple, int] = {(attachment['res_id'], attachment['checksum']): attachment['id']
+                                                for attachment in attachments}
+            for document in model_documents:
+                document.odoo_attachment_id = attachment_ids.get((document.odoo_id, document.checksum), 0)
+                if document.odoo_attachment_id:
+                    self.logger.info(f"{document.filename} is already attached to {document.name} "
+                                     f"as attachment {document.odoo_attachment_id}")
+                    found.append(document)
+
+        if not found:
+            return
+
+        # The documents.document may not have been made before the last run stopped
+        domain = [['attachment_id', 'in', [document.odoo_attachment_id for document in found]]]
+        records: typing.List[dict] = self._execute_kw('documents.document', 'search_read', [domain],
+                                                      {'fields': ['id', 'attachment_id']})
+        document_ids: dict[int, int] = {record['attachment_id'][0]: record['id'] for record in records if
+                                        record['attachment_id']}
+        for document in found:
+            document.odoo_document_id = document.odoo_document_id or document_ids.get(document.odoo_attachment_id, 0)
+
+        self._journal(found)
 
     def save_document(self, document: DocumentImage) -> int:
         """
-        Saves the document to Odoo by creating an attachment
+        Saves the document to Odoo by creating an attachment. Steps that already succeeded for this document
+        (e.g. in save_documents()) are not repeated.
         :param document:
         :type document: DocumentImage
         :return: The attachment ID
@@ -420,28 +2627,22 @@ class OdooConnector:
             try:
                 # Make sure we have a document id from Odoo, if not, get one
                 if document.odoo_id or self.odoo_document_id(document):
-                    with xmlrpc.client.ServerProxy(f'{self.url}/xmlrpc/2/object', allow_none=True,
-                                                   context=ssl._create_unverified_context()) as models:
-                        # Open file and send to Odoo to create ir.attachment
-                        with document.file.open('rb') as f:
-                            data = base64.b64encode(f.read())
-                            values = {
-                                'name': document.name.replace('/', '-') + '_' + document.filename.replace('/', '-'),
-                                'res_id': document.odoo_id,
-                                'res_model': self.config['documents'][document.document_type]['odoo_object'],
-                                'attachment_tag_id': self.config['documents'][document.document_type]['odoo_attachment_tag_id'],
-                                'datas': data.decode('ascii')}
-                            document.odoo_attachment_id = models.execute_kw(self.db, self.uid, self.password,
-                                                                            'ir.attachment', 'create', [values, ])
-                            # From ir.attachment, we create an Odoo document
-                            doc_values = {
-                                'attachment_id': document.odoo_attachment_id,
-                                'folder_id': self.config['documents'][document.document_type]['odoo_folder_id'],
-                                'active': True,
-                            }
-                            document.odoo_document_id = models.execute_kw(self.db, self.uid, self.password, 'documents.document', 'create', [doc_values, ])
-
-                            return document.odoo_document_id
+                    # Attachments a failed run already made don't need to be sent again
+                    if not document.odoo_attachment_id:
+                        self._existing_attachments([document])
+
+                    # Open file and send to Odoo to create ir.attachment
+                    if not document.odoo_attachment_id:
+                        document.odoo_attachment_id = self._execute_kw('ir.attachment', 'create',
+                                                                       [self._attachment_values(document), ])
+                        self._journal([document])
+                    # From ir.attachment, we create an Odoo document
+                    if not document.odoo_document_id:
+                        document.odoo_document_id = self._execute_kw('documents.document', 'create',
+                                                                     [self._document_values(document), ])
+                        self._journal([document])
+
+                    return document.odoo_document_id
                 else:
                     self.logger.error(
                         f'Save failed: document {document.name} from file: {document.filename} can not be saved in Odoo.')
@@ -456,6 +2657,55 @@ class OdooConnector:
 
         return 0
 
+    def save_documents(self, documents: typing.List[DocumentImage]) -> typing.List[int]:
+        """
+        Saves many documents to Odoo with one name lookup per model, one ir.attachment create and one
+        documents.document create. If a batch create fails, the documents are saved one at a time with
+        save_document(), so failures are still reported per document.
+        :param documents:
+        :type documents: list[DocumentImage]
+        :return: each document's documents.document ID, 0 if it was not saved
+        :rtype: list[int]
+        """
+
+        self.odoo_document_ids(documents)
+
+        saving: typing.List[DocumentImage] = []
+        for document in documents:
+            if document.odoo_id:
+                saving.append(document)
+            else:
+                self.logger.error(
+                    f'Save failed: document {document.name} from file: {document.filename} can not be saved in Odoo.')
+
+        try:
+            self._existing_attachments([document for document in saving if not document.odoo_attachment_id])
+
+            attaching: typing.List[DocumentImage] = [document for document in saving if
+                                                     not document.odoo_attachment_id]
+            if attaching:
+                attachment_ids: typing.List[int] = self._execute_kw(
+                    'ir.attachment', 'create', [[self._attachment_values(document) for document in attaching]])
+                for document, attachment_id in zip(attaching, attachment_ids):
+                    document.odoo_attachment_id = attachment_id
+                self._journal(attaching)
+
+            creating: typing.List[DocumentImage] = [document for document in saving if not document.odoo_document_id]
+            if creating:
+                document_ids: typing.List[int] = self._execute_kw(
+                    'documents.document', 'create', [[self._document_values(document) for document in creating]])
+                for document, document_id in zip(creating, document_ids):
+                    document.odoo_document_id = document_id
+                self._journal(creating)
+
+        except Exception as e:
+            self.logger.warning(e)
+            self.logger.exception(f"There was a problem saving {len(saving)} documents in Odoo. Saving one at a time.")
+            for document in saving:
+                self.save_document(document)
+
+        return [document.odoo_document_id for document in documents]
+
 
 class FileManager:
 
@@ -516,13 +2766,158 @@ class FileManager:
         for path in paths:
             files_list.extend(self._get_paths_from_string(path))
 
-        for document in files_list:
+        yield from self.documents(files_list)
+
+    def documents(self, files: typing.Iterable[Path]) -> typing.Generator[DocumentImage, None, None]:
+        """
+        Returns a generator that yields a DocumentImage object for each file that can be opened
+
+        :param files: the files to process
+        :type files: typing.Iterable[Path]
+        :return: generator for DocumentImage(s)
+        :rtype: typing.Generator[DocumentImage]
+        """
+
+        for document in files:
             try:
-                yield DocumentImage(self.config, document)
+                document = DocumentImage(self.config, document)
+                documents: typing.List[DocumentImage] = [document]
+                # Parts left over from a split batch aren't split again
+                document.source = self._batch(document.file)
+                if document.source is None and document.document_type and \
+                        self.config['documents'][document.document_type].get('split_pages'):
+                    documents = self.split(document)
             except Exception as e:
                self.logger.warning(f"Unable to parse file {document}. IGNORING.")
                continue
 
+            yield from documents
+
+    def split(self, document: DocumentImage) -> typing.List[DocumentImage]:
+        """
+        Splits a batch scan of many documents, e.g. a stack of invoices, into one document per name. Used for document
+        types with split_pages set. Every page is read, and consecutive pages with the same name, or with no name of
+        their own, make up a document. Each one is written to its own file named for its pages, e.g.
+        batch-p3-5.pdf, in the 'split-path' directory (default split) next to the batch, so that it is uploaded,
+        mailed and moved like any other file. The batch itself goes to the batches directory under done-path.
+
+        Documents that were split off but never finished, e.g. because the run stopped before they were uploaded, are
+        picked up from 'split-path' the next time the batch's directory is processed or watched, see leftover_parts().
+
+        :param document: the batch scan
+        :type document: DocumentImage
+        :return: the documents it holds, in page order
+        :rtype: list[DocumentImage]
+        """
+
+        if document.page_count < 2:
+            return [document]
+        if document.mime_type == PDF_MIME_TYPE and pypdf is None:
+            self.logger.warning(f"The pypdf module is needed to split {document.filename}. Reading it as one document.")
+            return [document]
+
+        # [first page, last page, name] for each document in the batch
+        groups: typing.List[list] = []
+        for page, name in enumerate(document.page_names(), 1):
+            if groups and (not name or name == groups[-1][2]):
+                groups[-1][1] = page
+            else:
+                groups.append([page, page, name])
+
+        split_path: Path = document.file.parent.joinpath(self.config.get('split-path', 'split'))
+        split_path.mkdir(exist_ok=True, parents=True)
+
+        documents: typing.List[DocumentImage] = []
+        for first, last, name in groups:
+            pages: str = f"p{first}" if first == last else f"p{first}-{last}"
+            part_file: Path = split_path.joinpath(f"{document.file.stem}-{pages}{document.file.suffix}")
+            self._write_pages(document, first, last, part_file)
+
+            part = DocumentImage(self.config, part_file)
+            part.source = document.file
+            part._name = name
+            if not name:
+                # Nothing to read again, it goes to be mailed
+                part._threshold_region_ignore = self.config['documents'][part.document_type][
+                                                    'threshold_region_ignore_min'] - 1
+            documents.append(part)
+            self.logger.info(f"Split {name or 'unreadable pages'} {pages} from {document.filename} -> {part_file}")
+
+        batches_path: Path = document.file.parent.joinpath(self.config['done-path'], "batches")
+        batches_path.mkdir(exist_ok=True, parents=True)
+        document.file = document.file.replace(batches_path.joinpath(document.file.name))
+
+        return documents
+
+    def leftover_parts(self, directories: typing.Iterable[Path]) -> typing.List[Path]:
+        """
+        The documents split from batch scans in the directories that were never finished, i.e. are still in the
+        directories' split-path, see split(). The batches themselves have already been moved away.
+        :param directories: the directories batch scans are processed in
+        :type directories: typing.Iterable[Path]
+        :return: files in split-path
+        :rtype: list[Path]
+        """
+
+        files: typing.List[Path] = []
+        for directory in directories:
+            split_path: Path = directory.joinpath(self.config.get('split-path', 'split'))
+            if split_path.is_dir():
+                files.extend(sorted(file for file in split_path.iterdir() if file.is_file() and self._batch(file)))
+
+        if files:
+            self.logger.info(f"Found {len(files)} documents left over from splitting batch scans")
+
+        return files
+
+    def _batch(self, file: Path) -> typing.Optional[Path]:
+        """
+        The batch scan a file in split-path was split from, see split()
+        :param file:
+        :type file: Path
+        :return: where the batch was, or None if the file wasn't split from one
+        :rtype: Path
+        """
+
+        split_parts: tuple = Path(self.config.get('split-path', 'split')).parts
+        m: typing.Optional[re.Match] = re.fullmatch(r"(.+)-p\d+(-\d+)?", file.stem)
+        if not m or len(file.parent.parts) <= len(split_parts) or file.parent.parts[-len(split_parts):] != split_parts:
+            return None
+
+        return file.parents[len(split_parts)].joinpath(m.group(1) + file.suffix)
+
+    @staticmethod
+    def _write_pages(document: DocumentImage, first: int, last: int, file: Path) -> None:
+        """
+        Writes pages first to last of a multi-page PDF or TIFF to a new file of the same type
+        :param document: the multi-page document
+        :type document: DocumentImage
+        :param first: first page, starting at 1
+        :type first: int
+        :param last: last page
+        :type last: int
+        :param file: the file to write
+        :type file: Path
+        :return: None
+        :rtype: None
+        """
+
+        if document.mime_type == PDF_MIME_TYPE:
+            reader = pypdf.PdfReader(io.BytesIO(document.data))
+            writer = pypdf.PdfWriter()
+            for page in range(first - 1, last):
+                writer.add_page(reader.pages[page])
+            with file.open('wb') as f:
+                writer.write(f)
+            return
+
+        with Image.open(io.BytesIO(document.data)) as image:
+            frames: typing.List[Image.Image] = []
+            for page in range(first - 1, last):
+                image.seek(page)
+                frames.append(image.copy())
+            frames[0].save(file, save_all=True, append_images=frames[1:], compression=image.info.get('compression'))
+
     def done(self, document: DocumentImage) -> str:
         """
         Relocates file that has been processed to storage directory
@@ -532,13 +2927,14 @@ class FileManager:
         :rtype: str
         """
 
-        done_top_dir: Path = Path(f"{document.file.parent}/{self.config['done-path']}")
+        # Documents split from a batch scan are in the batch's split-path directory, see split()
+        done_top_dir: Path = Path(f"{(document.source or document.file).parent}/{self.config['done-path']}")
 
         # If this document wasn't read, but has been emailed, short circuit
         if not document.name and document.is_emailed:
             done_path: Path = done_top_dir.joinpath("unreadable")
             done_path.mkdir(exist_ok=True, parents=True)
-            document.file = document.file.replace(done_path.joinpath(str(document.file)))
+            document.file = document.file.replace(done_path.joinpath(document.file.name))
             self.logger.warning(f"Moved unreadable file -> {document.filename}")
             return document.filename
 
@@ -564,7 +2960,7 @@ class FileManager:
         if not document.odoo_id or not document.odoo_attachment_id:
             self.logger.warning(f"Document {document.name} file:{document.filename} is not saved to Odoo")
 
-        new_file_name = f"{document.name.replace('/', '-')}_id-{document.odoo_id}_aid-{document.odoo_attachment_id}_{document.filename}"
+        new_file_name = f"{document.name.replace('/', '-')}_id-{document.odoo_id}_aid-{document.odoo_attachment_id}_{document.file.name}"
 
         self.logger.debug(f"Targeting {new_file_name} for file {document.filename}")
 
@@ -619,11 +3015,10 @@ class MailSender:
                 # Add the files
                 mime_maintype: str
                 mime_subtype: str
-                mime_type: str = document.mime_type if document.mime_type is not None or "" else "application/octet-stream"
+                data, mime_type, file_name = document.upload
+                mime_type = mime_type or "application/octet-stream"
                 mime_maintype, mime_subtype = mime_type.split('/', 1)
-                with document.file.open('rb') as fp:
-                    msg.add_attachment(fp.read(), maintype=mime_maintype, subtype=mime_subtype,
-                                       filename=document.filename)
+                msg.add_attachment(bytes(data), maintype=mime_maintype, subtype=mime_subtype, filename=file_name)
 
                 # Email the message
                 with SMTP(host=self.config['smtp-server'], port=self.config['smtp-port']) as smtp:
@@ -645,6 +3040,514 @@ class MailSender:
                 sleep(self.config['retry_sleep'])
 
 
+class DirectoryWatcher:
+
+    # From <sys/inotify.h>
+    IN_CLOSE_WRITE: int = 0x00000008
+    IN_MOVED_TO: int = 0x00000080
+    IN_Q_OVERFLOW: int = 0x00004000
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, config: dict, directories: typing.List[Path]) -> None:
+        """
+        Watches directories for files that are ready to be processed, i.e. that have been completely written. On Linux,
+        inotify reports files as soon as the writer closes them or they are moved in. Every watch-poll-interval
+        seconds, the directories are also scanned and files whose size and modification time have not changed for
+        watch-settle-time seconds are reported. That catches files inotify can't see, e.g. written by another host
+        to an NFS share.
+
+        :param config: configuration data from the YAML config file returned by get_configuration()
+        :type config: dict
+        :param directories: the directories to watch, not including subdirectories
+        :type directories: list[Path]
+        """
+
+        self.config: dict = config
+        self.logger: logging.Logger = config['logger']
+        self.directories: typing.List[Path] = directories
+        self.poll_interval: float = config.get('watch-poll-interval', 30)
+        self.settle_time: float = config.get('watch-settle-time', 2)
+
+        # Files found by a scan that may still be written to: path -> (size, mtime, when we looked)
+        self._pending: dict[Path, tuple[int, float, float]] = {}
+
+        # Files already reported: path -> (size, mtime). They are reported again only if they change.
+        self._reported: dict[Path, tuple[int, float]] = {}
+
+        self._inotify_fd: int = -1
+        self._watches: dict[int, Path] = {}
+        self._start_inotify()
+
+    def _start_inotify(self) -> None:
+        """
+        Sets up inotify watches on the directories, if the platform has inotify
+        :return: None
+        :rtype: None
+        """
+
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+            for directory in self.directories:
+                wd: int = libc.inotify_add_watch(fd, os.fsencode(directory), self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"{directory}: {os.strerror(ctypes.get_errno())}")
+                self._watches[wd] = directory
+
+            self._inotify_fd = fd
+
+        except (AttributeError, OSError) as e:
+            self.logger.warning(f"inotify is not available ({e}). Scanning directories every {self.poll_interval}s.")
+
+    def files(self) -> typing.Generator[Path, None, None]:
+        """
+        Returns a generator that yields files as they become ready. Files already in the directories are yielded
+        first. The generator never ends.
+        :return: generator for ready files
+        :rtype: typing.Generator[Path]
+        """
+
+        next_scan: float = 0
+
+        while True:
+            if monotonic() >= next_scan:
+                self._scan()
+                next_scan = monotonic() + self.poll_interval
+
+            yield from self._settled()
+
+            # Sleep until there is an event, a pending file may have settled or it is time to scan again
+            wake: float = min([next_scan] + [looked + self.settle_time for size, mtime, looked in
+                                             self._pending.values()])
+            yield from self._events(max(wake - monotonic(), 0))
+
+    def _scan(self) -> None:
+        """
+        Looks for new or changed files in the directories
+        :return: None
+        :rtype: None
+        """
+
+        present: set[Path] = set()
+
+        for directory in self.directories:
+            try:
+                files: typing.List[Path] = [file for file in directory.iterdir() if file.is_file()]
+            except OSError as e:
+                self.logger.warning(f"Unable to scan {directory}: {e}")
+                continue
+
+            for file in files:
+                present.add(file)
+                if file in self._pending:
+                    continue
+                try:
+                    stat: os.stat_result = file.stat()
+                except OSError:
+                    continue
+                if self._reported.get(file) != (stat.st_size, stat.st_mtime):
+                    self._pending[file] = (stat.st_size, stat.st_mtime, monotonic())
+
+        # Forget files that have been moved away
+        for file in list(self._reported):
+            if file not in present:
+                del self._reported[file]
+
+    def _settled(self) -> typing.Generator[Path, None, None]:
+        """
+        Yields pending files that have not changed for settle_time seconds
+        :return: generator for ready files
+        :rtype: typing.Generator[Path]
+        """
+
+        for file, (size, mtime, looked) in list(self._pending.items()):
+            if monotonic() - looked < self.settle_time:
+                continue
+
+            try:
+                stat: os.stat_result = file.stat()
+            except OSError:
+                del self._pending[file]
+                continue
+
+            if (stat.st_size, stat.st_mtime) == (size, mtime):
+                yield from self._report(file)
+            else:
+                self._pending[file] = (stat.st_size, stat.st_mtime, monotonic())
+
+    def _events(self, timeout: float) -> typing.Generator[Path, None, None]:
+        """
+        Waits up to timeout seconds for inotify events and yields the files they are about
+        :param timeout: seconds to wait
+        :type timeout: float
+        :return: generator for ready files
+        :rtype: typing.Generator[Path]
+        """
+
+        if self._inotify_fd < 0:
+            sleep(timeout)
+            return
+
+        readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+        if not readable:
+            return
+
+        buffer: bytes = os.read(self._inotify_fd, 64 * 1024)
+        offset: int = 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = self._EVENT.unpack_from(buffer, offset)
+            name: bytes = buffer[offset + self._EVENT.size:offset + self._EVENT.size + length].rstrip(b'\0')
+            offset += self._EVENT.size + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # We missed events, the next scan will find the files
+                self.logger.warning("inotify queue overflowed. Scanning directories.")
+                self._scan()
+                continue
+
+            if wd in self._watches and name:
+                file: Path = self._watches[wd].joinpath(os.fsdecode(name))
+                if file.is_file():
+                    yield from self._report(file)
+
+    def _report(self, file: Path) -> typing.Generator[Path, None, None]:
+        """
+        Yields the file unless it has already been reported unchanged, e.g. because it could not be moved away
+        :param file: a ready file
+        :type file: Path
+        :return: generator for the file
+        :rtype: typing.Generator[Path]
+        """
+
+        self._pending.pop(file, None)
+
+        try:
+            stat: os.stat_result = file.stat()
+        except OSError:
+            return
+
+        if self._reported.get(file) == (stat.st_size, stat.st_mtime):
+            return
+
+        self._reported[file] = (stat.st_size, stat.st_mtime)
+        self.logger.debug(f"{file} is ready")
+        yield file
+
+
+class Pipeline:
+
+    def __init__(self, config: dict, ocr_workers: int = 0, upload_workers: int = 1) -> None:
+        """
+        Runs documents from discovery through OCR, upload to Odoo, mailing of failures and moving them to done.
+
+        With ocr_workers, OCR runs in that many processes while upload_workers threads talk to Odoo and the mail
+        server. The stages are connected by bounded queues, so discovery and OCR wait when uploads fall behind.
+        Documents are saved to Odoo in batches of up to upload-batch-size.
+
+        :param config: configuration data from the YAML config file returned by get_configuration()
+        :type config: dict
+        :param ocr_workers: number of OCR processes, 0 processes documents one at a time
+        :type ocr_workers: int
+        :param upload_workers: number of upload threads when ocr_workers is set
+        :type upload_workers: int
+        """
+
+        self.config: dict = config
+        self.logger: logging.Logger = config['logger']
+        self.ocr_workers: int = ocr_workers
+        self.upload_workers: int = max(upload_workers, 1)
+        self.queue_size: int = config.get('pipeline-queue-size', 2 * max(ocr_workers, self.upload_workers))
+        self.batch_size: int = max(config.get('upload-batch-size', 10), 1)
+
+        self.journal: typing.Optional[Journal] = Journal(config) if config.get('journal-file') else None
+        self.statistics_interval: float = config.get('statistics-interval', 300)
+        self._statistics_saved: float = monotonic()
+        self.file_manager: FileManager = FileManager(config)
+        self.odoo: OdooConnector = OdooConnector(config, self.journal)
+        self.mailer: MailSender = MailSender(config)
+
+    def run(self, paths: typing.List[str]) -> None:
+        """
+        Processes all files, directories and file globs in paths
+        :param paths: a list of files or file globs to process
+        :type paths: list[str]
+        :return: None
+        :rtype: None
+        """
+
+        directories: typing.List[Path] = []
+        files: typing.List[Path] = []
+        for path in paths:
+            directory: Path = Path(path) if Path(path).is_dir() else Path(path).parent
+            if directory not in directories:
+                directories.append(directory)
+            files.extend(self.file_manager._get_paths_from_string(path))
+
+        self.process(self.file_manager.leftover_parts(directories) + files, self.batch_size)
+
+    def watch(self, paths: typing.List[str]) -> None:
+        """
+        Processes files as they arrive in the directories in paths, until the process is stopped
+        :param paths: a list of directories to watch
+        :type paths: list[str]
+        :return: None
+        :rtype: None
+        """
+
+        directories: typing.List[Path] = []
+        for path in paths:
+            if Path(path).is_dir():
+                directories.append(Path(path))
+            else:
+                self.logger.warning(f"{path} is not a directory and can not be watched. Ignoring.")
+
+        # Don't hold documents back waiting for a batch to fill up, upload threads batch whatever is waiting
+        self.process(itertools.chain(self.file_manager.leftover_parts(directories),
+                                     DirectoryWatcher(self.config, directories).files()), 1)
+
+    def process(self, files: typing.Iterable[Path], batch_size: int) -> None:
+        """
+        Processes files, either one at a time or in parallel if there are OCR workers
+        :param files: the files to process
+        :type files: typing.Iterable[Path]
+        :param batch_size: the number of documents to save to Odoo at once when processing one at a time
+        :type batch_size: int
+        :return: None
+        :rtype: None
+        """
+
+        try:
+            if self.ocr_workers:
+                self._run_parallel(files)
+            else:
+                documents: typing.List[DocumentImage] = []
+                for document in self.file_manager.documents(files):
+                    if document.document_type:
+                        if self.journal:
+                            self.journal.resume(document)
+                            if document.read_name() or document.unreadable:
+                                self.journal.record(document)
+                        documents.append(document)
+
+                    if len(documents) >= batch_size:
+                        self.upload(documents)
+                        documents = []
+                        self.save_statistics()
+
+                if documents:
+                    self.upload(documents)
+
+        finally:
+            self.odoo.close()
+            if self.journal:
+                self.journal.close()
+            self.save_statistics(True)
+
+    def save_statistics(self, force: bool = False) -> None:
+        """
+        Saves the statistics, if they are being kept, when statistics-interval seconds have passed since they were last
+        saved. A watcher can be killed without warning, so they can't wait for it to exit.
+        :param force: save them now
+        :type force: bool
+        :return: None
+        :rtype: None
+        """
+
+        if 'statistics' in self.config and (force or monotonic() - self._statistics_saved >= self.statistics_interval):
+            save_statistics(self.config)
+            self._statistics_saved = monotonic()
+
+    def upload(self, documents: typing.List[DocumentImage]) -> None:
+        """
+        Saves documents to Odoo, or mails the ones that can't be saved, then moves them to the done directory
+        :param documents:
+        :type documents: list[DocumentImage]
+        :return: None
+        :rtype: None
+        """
+
+        self.odoo.save_documents(documents)
+
+        for document in documents:
+            if document.odoo_document_id:
+                self.logger.info(
+                    f"Saved {document.name} ID: {document.odoo_id} document:{document.odoo_document_id} to odoo server: {self.config['server']}")
+            elif not document.is_emailed:
+                self.logger.error(f"Unable to process file: {document.filename}. Mailing to {self.config['error-email']}")
+                self.mailer.mail_document(document)
+                if self.journal:
+                    self.journal.record(document)
+
+            moved: bool = bool(self.file_manager.done(document))
+            if self.journal:
+                self.journal.record(document, moved)
+
+            document.close()
+
+    def _run_parallel(self, files: typing.Iterable[Path]) -> None:
+        """
+        Feeds files to the OCR processes and hands their documents to the upload threads
+        :param files: the files to process
+        :type files: typing.Iterable[Path]
+        :return: None
+        :rtype: None
+        """
+
+        context = multiprocessing.get_context()
+        file_queue = context.Queue(self.queue_size)
+        results = context.Queue(self.queue_size)
+        uploads: queue.Queue = queue.Queue(self.queue_size)
+
+        ocr_processes: typing.List[multiprocessing.Process] = [
+            context.Process(target=_ocr_worker, args=(self.config, file_queue, results), name=f"OCR-{i}", daemon=True)
+            for i in range(self.ocr_workers)]
+        upload_threads: typing.List[threading.Thread] = [
+            threading.Thread(target=self._upload_worker, args=(uploads,), name=f"Upload-{i}")
+            for i in range(self.upload_workers)]
+
+        for worker in ocr_processes + upload_threads:
+            worker.start()
+
+        threading.Thread(target=self._feed, args=(files, file_queue), name="Feeder", daemon=True).start()
+
+        # Each OCR process sends None when it runs out of files
+        finished: int = 0
+        try:
+            while finished < len(ocr_processes):
+                try:
+                    document: typing.Optional[DocumentImage] = results.get(timeout=1)
+                except queue.Empty:
+                    # Don't wait forever on processes that died without saying goodbye (e.g. OOM)
+                    if not any(process.is_alive() for process in ocr_processes) and results.empty():
+                        self.logger.error("All OCR processes have exited.")
+                        break
+                    continue
+
+                if document is None:
+                    finished += 1
+                    continue
+
+                # The document comes back without the configuration, it belongs to this process
+                document.config = self.config
+                document.logger = self.logger
+                document.record_statistics()
+                if self.journal and (document.name or document.unreadable):
+                    self.journal.record(document)
+                uploads.put(document)
+                self.save_statistics()
+
+        finally:
+            # Let the upload threads finish what they have, even if we are being stopped
+            for _ in upload_threads:
+                uploads.put(None)
+
+            for thread in upload_threads:
+                thread.join()
+
+            for process in ocr_processes:
+                if finished < len(ocr_processes):
+                    process.terminate()
+                process.join()
+
+    def _feed(self, files: typing.Iterable[Path], file_queue: multiprocessing.Queue) -> None:
+        """
+        Puts every file on the OCR queue, followed by one None per OCR process
+        :param files: the files to process
+        :type files: typing.Iterable[Path]
+        :param file_queue: the OCR queue
+        :type file_queue: multiprocessing.Queue
+        :return: None
+        :rtype: None
+        """
+
+        for file in files:
+            file_queue.put(file)
+
+        for _ in range(self.ocr_workers):
+            file_queue.put(None)
+
+    def _upload_worker(self, uploads: queue.Queue) -> None:
+        """
+        Uploads documents in batches of up to upload-batch-size until it gets None from the queue
+        :param uploads: documents that have been read
+        :type uploads: queue.Queue
+        :return: None
+        :rtype: None
+        """
+
+        finished: bool = False
+        while not finished:
+            # Wait for one document, then take whatever else is already waiting to fill the batch
+            documents: typing.List[DocumentImage] = []
+            document: typing.Optional[DocumentImage] = uploads.get()
+            while document is not None:
+                documents.append(document)
+                if len(documents) >= self.batch_size:
+                    break
+                try:
+                    document = uploads.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                finished = True
+
+            if not documents:
+                continue
+
+            try:
+                self.upload(documents)
+            except Exception:
+                self.logger.exception(f"Unable to upload files {', '.join(d.filename for d in documents)}.")
+
+
+def _ocr_worker(config: dict, files: multiprocessing.Queue, results: multiprocessing.Queue) -> None:
+    """
+    Runs in a Pipeline OCR process. Reads the name of each file from the files queue and puts the DocumentImage on the
+    results queue. Sends None when the files queue says we are done.
+
+    :param config: configuration data from the YAML config file returned by get_configuration()
+    :type config: dict
+    :param files: files to read
+    :type files: multiprocessing.Queue
+    :param results: DocumentImages that have been read
+    :type results: multiprocessing.Queue
+    :return: None
+    :rtype: None
+    """
+
+    logger: logging.Logger = config['logger']
+    journal: typing.Optional[Journal] = Journal(config) if config.get('journal-file') else None
+    file_manager: FileManager = FileManager(config)
+
+    while True:
+        file: typing.Optional[Path] = files.get()
+        if file is None:
+            break
+
+        # Batch scans are split into several documents here
+        for document in file_manager.documents([file]):
+            try:
+                if document.document_type:
+                    # Files we have seen before don't need to be read again
+                    if journal:
+                        journal.resume(document)
+
+                    # Reading the name is the expensive part, get it done here
+                    name: str = document.read_name()
+                    logger.debug(f"Read {name} from {document.filename}")
+                    results.put(document)
+            except Exception:
+                logger.warning(f"Unable to parse file {file}. IGNORING.")
+
+    if journal:
+        journal.close()
+
+    results.put(None)
+
+
 def _parse_args():
     # Get configuration from environmental variables or command line
     parser = argparse.ArgumentParser(description="Script to read scanned documents and send them to Odoo")
@@ -657,6 +3560,14 @@ def _parse_args():
                             help="The path to the YAML configuration file. Defaults to /etc/docscanner.conf")
         parser.add_argument('-v', '--verbose', dest='debug', action='store_true', help="enable verbose output")
         parser.add_argument('--stats', action='store_true', help="store region statistics in file")
+        parser.add_argument('--watch', action='store_true',
+                            help="keep running and process files as they arrive in the directories given")
+        parser.add_argument('--ocr-workers', dest='ocr_workers', type=int,
+                            default=int(os.environ.get("DS_OCR_WORKERS", 0)),
+                            help="number of OCR processes. Defaults to 0, processing one document at a time")
+        parser.add_argument('--upload-workers', dest='upload_workers', type=int,
+                            default=int(os.environ.get("DS_UPLOAD_WORKERS", 2)),
+                            help="number of threads uploading to Odoo when using --ocr-workers. Defaults to 2")
         parser.add_argument('file', type=str, nargs='+',
                             help="The file, files or directories to process. Can be more than one. (required)")
 
@@ -668,6 +3579,22 @@ def _parse_args():
         sys.exit(1)
 
 
+def save_statistics(config: dict) -> None:
+    """
+    Writes the statistics to the statistics file. They are written to a temporary file that replaces it, so a process
+    killed while writing leaves the last statistics in place.
+    :param config: configuration data from the YAML config file returned by get_configuration()
+    :type config: dict
+    :return: None
+    :rtype: None
+    """
+
+    stats_file: Path = Path(config['statistics-file'])
+    with tempfile.NamedTemporaryFile('w', dir=stats_file.parent, prefix=stats_file.name, delete=False) as f:
+        yaml.safe_dump(config['statistics'], f)
+    os.replace(f.name, stats_file)
+
+
 def get_configuration(config_file_name: str, server: str = "development", debug: bool = False,
                       stats: bool = False) -> dict:
     """
@@ -698,6 +3625,11 @@ def get_configuration(config_file_name: str, server: str = "development", debug:
         # Keep track of debug
         config['debug'] = debug
 
+        # Regions found at pdf-detection-dpi are scaled up by a whole number to be rendered again at pdf-dpi
+        if config.get('pdf-detection-dpi') and config.get('pdf-dpi', 350) % config['pdf-detection-dpi']:
+            raise ValueError(f"pdf-dpi {config.get('pdf-dpi', 350)} is not a multiple of pdf-detection-dpi "
+                             f"{config['pdf-detection-dpi']}")
+
         # Set up statistics, if needed
         if stats:
             stats_file = Path(config['statistics-file'])
@@ -739,39 +3671,25 @@ def main():
     args = _parse_args()
     config = get_configuration(args.config_file, args.server, args.debug, args.stats)
 
-    logger = config['logger']
-
-    # get path to tesseract from config
-    pytesseract.pytesseract.tesseract_cmd = config['tesseract-bin']
-
-    # Improve OCR by increasing threads to max cpus minus one
-    try:
-        os.environ['OMP_THREAD_LIMIT'] = str((len(psutil.Process().cpu_affinity()) - 1) or 1)
-
-    except AttributeError:
-        os.environ['OMP_THREAD_LIMIT'] = str((psutil.cpu_count() - 1) or 1)
+    # Improve OCR by increasing threads to max cpus minus one. With several OCR processes, they share the cpus instead
+    if args.ocr_workers:
+        os.environ['OMP_THREAD_LIMIT'] = "1"
+    else:
+        try:
+            os.environ['OMP_THREAD_LIMIT'] = str((len(psutil.Process().cpu_affinity()) - 1) or 1)
 
-    # get our manager objects
-    file_manager: FileManager = FileManager(config)
-    odoo: OdooConnector = OdooConnector(config)
-    mailer: MailSender = MailSender(config)
+        except AttributeError:
+            os.environ['OMP_THREAD_LIMIT'] = str((psutil.cpu_count() - 1) or 1)
 
-    # Get the documents
-    documents: typing.Generator[DocumentImage, None, None] = file_manager.document_generator(args.file)
+    pipeline: Pipeline = Pipeline(config, args.ocr_workers, args.upload_workers)
 
-    for document in documents:
-        if document.document_type:
-            if odoo.save_document(document):
-                logger.info(f"Saved {document.name} ID: {document.odoo_id} document:{document.odoo_document_id} to odoo server: {args.server}")
-            else:
-                logger.error(f"Unable to process file: {document.filename}. Mailing to {config['error-email']}")
-                mailer.mail_document(document)
-
-            file_manager.done(document)
-    # Save statistics before we exit
-    if args.stats:
-        with open(config['statistics-file'], 'w') as f:
-            yaml.safe_dump(config['statistics'], f)
+    # Statistics are saved as documents are processed and when the pipeline stops, see Pipeline.save_statistics()
+    if args.watch:
+        # Stop cleanly when the container is stopped
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        pipeline.watch(args.file)
+    else:
+        pipeline.run(args.file)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,16 @@
 #!/bin/sh
 
+# tini only signals this shell, pass docker stop's SIGTERM on to docscanner so it can save its statistics, then stop
+# instead of starting it again
+trap 'kill -TERM $child 2>/dev/null; wait $child; exit 0' TERM INT
+
+# docscanner watches /scanner itself, only start it again if it exits
 while /bin/true
 do
-   su -l -c "cd /scanner; /docscanner.py --stats ." scanner
-   sleep 300
+   su -l -c "cd /scanner; exec /docscanner.py --stats --watch ." scanner &
+   child=$!
+   wait $child
+   sleep 30 &
+   child=$!
+   wait $child
 done
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import shutil
+import tempfile
 from unittest import TestCase
 
 import docscanner
@@ -20,6 +22,29 @@ class TestGetConfiguration(TestCase):
         self.assertEqual("/usr/bin/tesseract", config['tesseract-bin'])
         self.assertEqual("account.move", config['documents']['Invoice']['odoo_object'])
 
+    def test_pdf_detection_dpi(self) -> None:
+        config_file = Path("./test_pdf_detection_dpi.yaml")
+        settings = yaml.safe_load(self.config_file.read_text())
+        settings['pdf-dpi'] = 350
+        settings['pdf-detection-dpi'] = 150
+        config_file.write_text(yaml.safe_dump(settings))
+
+        try:
+            self.assertRaises(ValueError, get_configuration, str(config_file), self.server)
+        finally:
+            config_file.unlink()
+
+    def test_save_statistics(self) -> None:
+        config = get_configuration(self.config_file_name, self.server)
+        config['statistics-file'] = "./test_statistics.yaml"
+        config['statistics'] = {'Invoice': {1: 3, 'hot_zone': [0.1, 0.2, 0.5, 0.3]}}
+
+        try:
+            save_statistics(config)
+            self.assertEqual(config['statistics'], yaml.safe_load(Path(config['statistics-file']).read_text()))
+        finally:
+            Path(config['statistics-file']).unlink(missing_ok=True)
+
 
 class TestOdooConnector(TestCase):
     def setUp(self) -> None:
@@ -30,6 +55,11 @@ class TestOdooConnector(TestCase):
     def test_constructor(self):
         conn = OdooConnector(self.config)
 
+    def test_unknown_protocol(self):
+        self.config['odoo-protocol'] = 'soap'
+        with self.assertRaises(ValueError):
+            OdooConnector(self.config)
+
     def test_get_uid(self):
         conn = OdooConnector(self.config)
         self.assertTrue(conn.uid, 39)
@@ -49,6 +79,87 @@ class TestOdooConnector(TestCase):
 
         self.assertGreater(doc_id, 0, "Odoo did not return an ID, doc did not save.")
 
+    def test_odoo_document_ids(self):
+        conn = OdooConnector(self.config)
+        documents = [DocumentImage(self.config, self.test_invoice_file),
+                     DocumentImage(self.config, "bad_Customer_Invoice1.jpg")]
+
+        self.assertEqual(conn.odoo_document_ids(documents), [267485, 0])
+        self.assertEqual(documents[0].odoo_id, 267485)
+
+    def test_save_documents(self):
+        conn = OdooConnector(self.config)
+        documents = [DocumentImage(self.config, self.test_invoice_file),
+                     DocumentImage(self.config, "2-Customer_Invoice-INV-2022-10515-2.jpg")]
+
+        doc_ids = conn.save_documents(documents)
+
+        self.assertEqual(len(doc_ids), 2)
+        for document, doc_id in zip(documents, doc_ids):
+            self.assertGreater(doc_id, 0, f"Odoo did not return an ID, {document.filename} did not save.")
+            self.assertGreater(document.odoo_attachment_id, 0)
+
+
+class TestStreamingBody(TestCase):
+
+    def test_same_as_dumps(self):
+        """
+        Testing that a streamed request is the one xmlrpc.client would have sent
+        :return: None
+        :rtype: None
+        """
+        data = Path("1-Customer_Invoice-INV-2022-11528.jpg").read_bytes()
+        streamed = {'name': "INV-2022-11528 <&>", 'datas': Base64Stream(data)}
+        encoded = {'name': "INV-2022-11528 <&>", 'datas': base64.b64encode(data).decode('ascii')}
+
+        body = xmlrpc_request('execute_kw', ("db", 1, "password", 'ir.attachment', 'create', [[streamed]], {}))
+        expected = xmlrpc.client.dumps(("db", 1, "password", 'ir.attachment', 'create', [[encoded]], {}),
+                                       'execute_kw', allow_none=True).encode()
+
+        self.assertIsInstance(body, StreamingBody)
+        self.assertEqual(len(expected), len(body))
+        self.assertEqual(expected, b''.join(body))
+        self.assertEqual(expected, b''.join(body), "The body should be the same when it is sent again.")
+
+    def test_jsonrpc(self):
+        """
+        Testing that a streamed JSON-RPC request has the file's contents in it
+        :return: None
+        :rtype: None
+        """
+        data = Path("1-Customer_Invoice-INV-2022-11528.jpg").read_bytes()
+        body = jsonrpc_request('object', 'execute_kw', ("db", 1, "password", 'ir.attachment', 'create',
+                                                        [[{'datas': Base64Stream(data)}]], {}))
+
+        request = json.loads(b''.join(body))
+        self.assertEqual(len(b''.join(body)), len(body))
+        self.assertEqual('execute_kw', request['params']['method'])
+        self.assertEqual(data, base64.b64decode(request['params']['args'][5][0][0]['datas']))
+
+
+class TestOdooIndex(TestCase):
+    def setUp(self) -> None:
+        self.config = docscanner.get_configuration("./test_config.yaml", "development")
+        self.config['odoo-index-file'] = "./test_odoo_index.sqlite"
+        self.test_invoice_file = "1-Customer_Invoice-INV-2022-11528.jpg"
+        self.test_invoice_name = "INV/2022/11528"
+
+    def tearDown(self) -> None:
+        Path(self.config['odoo-index-file']).unlink(missing_ok=True)
+
+    def test_index_lookup(self):
+        conn = OdooConnector(self.config)
+        document = DocumentImage(self.config, self.test_invoice_file)
+
+        self.assertEqual(conn.index.get("account.move", self.test_invoice_name), 267485)
+        self.assertEqual(conn.odoo_document_id(document), 267485)
+        conn.close()
+
+        # A new connector reads the index from the file
+        conn = OdooConnector(self.config)
+        self.assertEqual(conn.index._ids["account.move"][self.test_invoice_name], 267485)
+        conn.close()
+
 
 class TestFileManager(TestCase):
 
@@ -129,6 +240,39 @@ class TestFileManager(TestCase):
         # reset file move
         document.file.replace(original_file)
 
+    def test_split(self):
+        """
+        Testing splitting a batch scan into one document per invoice
+        :return: None
+        :rtype: None
+        """
+        mgr = FileManager(self.config)
+        self.config['documents']['Invoice']['mime-types'].append(TIFF_MIME_TYPE)
+        self.config['documents']['Invoice']['split_pages'] = True
+
+        batch_file = Path("5-Customer_Invoice-batch.tif")
+        pages = [cv2.imread(file, cv2.IMREAD_GRAYSCALE) for file in
+                 (self.test_invoice_file, self.test_bad_invoice_file, "2-Customer_Invoice-INV-2022-10515-2.jpg")]
+        cv2.imwritemulti(str(batch_file), pages)
+
+        documents = list(mgr.documents([batch_file]))
+
+        try:
+            self.assertEqual(["INV/2022/11528", "INV/2022/10515"], [document.name for document in documents])
+            self.assertEqual(Path("split/5-Customer_Invoice-batch-p1-2.tif"), documents[0].file)
+            self.assertEqual(2, documents[0].page_count)
+            self.assertEqual(batch_file, documents[1].source)
+            self.assertTrue(Path(self.config['done-path'], "batches", batch_file.name).exists())
+
+            # Parts that weren't finished are picked up again, and not split any further
+            leftovers = mgr.leftover_parts([Path(".")])
+            self.assertEqual([document.file for document in documents], leftovers)
+            self.assertEqual([batch_file, batch_file], [document.source for document in mgr.documents(leftovers)])
+        finally:
+            for document in documents:
+                document.file.unlink()
+            Path(self.config['done-path'], "batches", batch_file.name).unlink()
+
     def test_bad_file_done(self):
         """
         Testing moving a Document to its done location
@@ -154,6 +298,125 @@ class TestFileManager(TestCase):
         document.file.replace(original_file)
 
 
+class TestJournal(TestCase):
+    def setUp(self) -> None:
+        self.config = docscanner.get_configuration("./test_config.yaml", "development")
+        self.config['journal-file'] = "./test_journal.sqlite"
+        self.test_invoice_file = "1-Customer_Invoice-INV-2022-11528.jpg"
+        self.test_invoice_name = "INV/2022/11528"
+
+    def tearDown(self) -> None:
+        Path(self.config['journal-file']).unlink(missing_ok=True)
+
+    def test_resume(self):
+        journal = Journal(self.config)
+        document = DocumentImage(self.config, self.test_invoice_file)
+
+        self.assertFalse(journal.resume(document))
+
+        document.odoo_id = 267485
+        document.odoo_attachment_id = 1
+        journal.record(document)
+
+        resumed = DocumentImage(self.config, self.test_invoice_file)
+        self.assertTrue(journal.resume(resumed))
+
+        # The name comes from the journal, not from reading the image
+        self.assertEqual(resumed._name, self.test_invoice_name)
+        self.assertEqual(resumed.odoo_id, 267485)
+        self.assertEqual(resumed.odoo_attachment_id, 1)
+        self.assertEqual(resumed.odoo_document_id, 0)
+        journal.close()
+
+    def test_resume_unreadable(self):
+        journal = Journal(self.config)
+        document = DocumentImage(self.config, "bad_Customer_Invoice1.jpg")
+        document.unreadable = True
+        document.is_emailed = True
+        journal.record(document)
+
+        resumed = DocumentImage(self.config, "bad_Customer_Invoice1.jpg")
+        self.assertTrue(journal.resume(resumed))
+
+        # Unreadable and already mailed, so it goes straight to the move step without reading the image again
+        self.assertTrue(resumed.unreadable)
+        self.assertTrue(resumed.is_emailed)
+        self.assertEqual(resumed.read_name(), "")
+        self.assertIsNone(resumed._image)
+        journal.close()
+
+
+class StubConnector:
+    """
+    Stands in for OdooConnector in Pipeline tests. Every document with a name is saved.
+    """
+
+    def __init__(self) -> None:
+        self.saved: list[str] = []
+
+    def save_documents(self, documents: list[DocumentImage]) -> list[int]:
+        for document in documents:
+            if document.name:
+                self.saved.append(document.name)
+                document.odoo_id = document.odoo_attachment_id = document.odoo_document_id = len(self.saved)
+        return [document.odoo_document_id for document in documents]
+
+    def close(self) -> None:
+        pass
+
+
+class TestPipeline(TestCase):
+    def setUp(self) -> None:
+        self.config = docscanner.get_configuration("./test_config.yaml", "development")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for file in ["1-Customer_Invoice-INV-2022-11528.jpg", "2-Customer_Invoice-INV-2022-10515-2.jpg",
+                     "3-Customer_Invoice-INV-2022-11528.pdf", "bad_Customer_Invoice1.jpg"]:
+            shutil.copy(file, self.directory.name)
+
+    def test_run_parallel(self):
+        pipeline = Pipeline(self.config, ocr_workers=2)
+        pipeline.odoo = StubConnector()
+        mailed: list[str] = []
+
+        def mail_document(document: DocumentImage) -> None:
+            mailed.append(document.file.name)
+            document.is_emailed = True
+
+        pipeline.mailer.mail_document = mail_document
+        pipeline.run([f"{self.directory.name}/*"])
+
+        self.assertEqual(sorted(pipeline.odoo.saved), ["INV/2022/10515", "INV/2022/11528", "INV/2022/11528"])
+        self.assertEqual(mailed, ["bad_Customer_Invoice1.jpg"])
+
+        # Every file has been moved to the done directory
+        self.assertEqual([f for f in Path(self.directory.name).iterdir() if f.is_file()], [])
+
+
+class TestDirectoryWatcher(TestCase):
+    def setUp(self) -> None:
+        self.config = docscanner.get_configuration("./test_config.yaml", "development")
+        self.config['watch-poll-interval'] = 0.1
+        self.config['watch-settle-time'] = 0.1
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_files(self):
+        files = DirectoryWatcher(self.config, [Path(self.directory.name)]).files()
+        first = Path(self.directory.name).joinpath("1-Customer_Invoice-INV-2022-11528.jpg")
+        second = Path(self.directory.name).joinpath("2-Customer_Invoice-INV-2022-10515-2.jpg")
+
+        first.write_bytes(Path("1-Customer_Invoice-INV-2022-11528.jpg").read_bytes())
+        self.assertEqual(next(files), first)
+
+        # The first file is seen by inotify and by several scans before the second arrives, it is yielded only once
+        timer = threading.Timer(1, second.write_bytes, (Path("2-Customer_Invoice-INV-2022-10515-2.jpg").read_bytes(),))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertEqual(next(files), second)
+        files.close()
+
+
 class TestMailer(TestCase):
     def setUp(self) -> None:
         self.bad_test_invoice_file1 = "bad_Customer_Invoice1.jpg"
@@ -179,6 +442,36 @@ class TestMailer(TestCase):
         self.assertTrue(self.bad_doc2.is_emailed)
 
 
+class TestOCREngine(TestCase):
+
+    def setUp(self) -> None:
+        self.config = docscanner.get_configuration("./test_config.yaml", "development")
+        self.test_invoice_file = "1-Customer_Invoice-INV-2022-11528.jpg"
+        self.test_invoice_name = "INV/2022/11528"
+
+    def test_engine_is_shared(self):
+        self.assertIs(get_ocr_engine(self.config), get_ocr_engine(self.config))
+
+    def test_unknown_engine(self):
+        config = dict(self.config, **{'ocr-engine': 'foo'})
+        with self.assertRaises(ValueError):
+            get_ocr_engine(config)
+
+    def test_engines_agree(self):
+        """
+        Testing that the pytesseract fallback and the persistent engine read the same text
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        image, line_items_coordinates = invoice._mark_region()
+
+        for engine in OCR_ENGINES:
+            invoice.config = dict(self.config, **{'ocr-engine': engine})
+            self.assertEqual(invoice._read_text(image, line_items_coordinates, -7),
+                             f"Draft Invoice {self.test_invoice_name}\n")
+
+
 class TestInvoice(TestCase):
 
     def setUp(self) -> None:
@@ -211,7 +504,55 @@ class TestInvoice(TestCase):
         self.assertEqual(doc_type, "Invoice")
 
     def test__mark_region(self):
-        pass
+        """
+        Testing that lowering the threshold reuses the contours found on the first pass
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        image, line_items_coordinates = invoice._mark_region()
+        regions = invoice._regions
+
+        invoice.threshold_region_ignore -= 40
+        image, more_line_items_coordinates = invoice._mark_region()
+
+        self.assertIs(regions, invoice._regions)
+        self.assertGreater(len(more_line_items_coordinates), len(line_items_coordinates))
+
+    def test__mark_region_decode_scale(self):
+        """
+        Testing that a reduced decode finds about the same regions as the full size image, so regions lists still
+        point at the same parts of the page
+        :return: None
+        :rtype: None
+        """
+        image, line_items_coordinates = DocumentImage(self.config, self.test_invoice_file)._mark_region()
+
+        self.config['documents']['Invoice']['decode_scale'] = 2
+        image, reduced_line_items_coordinates = DocumentImage(self.config, self.test_invoice_file)._mark_region()
+
+        self.assertLessEqual(abs(len(reduced_line_items_coordinates) - len(line_items_coordinates)), 2)
+
+    def test_detection_max_pixels(self):
+        """
+        Testing that regions found on a shrunk copy of the page are in full size pixels and still lead to the name
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        invoice._find_regions()
+        height, width = invoice._image.shape[:2]
+        bottom = (invoice._regions[:, 1] + invoice._regions[:, 3]).max()
+
+        self.config['documents']['Invoice']['detection_max_pixels'] = width * height // 4
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        invoice._find_regions()
+
+        # Found at half size, but scaled back up to the page
+        self.assertAlmostEqual((invoice._regions[:, 1] + invoice._regions[:, 3]).max(), bottom, delta=height // 50)
+        self.assertLessEqual((invoice._regions[:, 0] + invoice._regions[:, 2]).max(), width)
+
+        self.assertEqual(self.test_invoice_name, invoice.name)
 
     def test__read_text(self) -> None:
         """
@@ -247,6 +588,33 @@ class TestInvoice(TestCase):
         invoice = DocumentImage(self.config, self.test_invoice_file)
         self.assertEqual(self.test_invoice_name, invoice.name)
 
+    def test_name_from_ocr_cache(self):
+        """
+        Testing that a page read before gets its name from the OCR cache
+        :return: None
+        :rtype: None
+        """
+        self.config['ocr-cache-file'] = "./test_ocr_cache.sqlite"
+        self.addCleanup(Path(self.config['ocr-cache-file']).unlink, missing_ok=True)
+
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+        self.assertGreater(invoice.region, 0)
+        region, region_box = invoice.region, invoice.region_box
+
+        # Keys that don't change what is read keep the cached name, along with the region it was found in
+        self.config['documents']['Invoice']['odoo_folder_id'] = 42
+        cached = DocumentImage(self.config, self.test_invoice_file)
+        cached._read_page = lambda: self.fail("The name should not have been read from the image.")
+        self.assertEqual(self.test_invoice_name, cached.name)
+        self.assertEqual(region, cached.region)
+        self.assertEqual(region_box, cached.region_box)
+
+        # Keys that do change it read the image again
+        key = get_ocr_cache(self.config)._key(cached)
+        self.config['documents']['Invoice']['ocr_regex'] += "|"
+        self.assertNotEqual(key, get_ocr_cache(self.config)._key(cached))
+
     def test_name_setter(self):
         """
         Testing the public setter DocumentImage.name. Should throw an exception
@@ -273,6 +641,264 @@ class TestInvoice(TestCase):
         # Calling .name again re-reads the document image
         self.assertEqual(invoice.name, self.test_invoice_name)
 
+    def test_hot_zone(self):
+        """
+        Testing that a learned hot zone finds the name without looking for regions
+        :return: None
+        :rtype: None
+        """
+        self.config['statistics'] = {'Invoice': {}}
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+        self.assertIn('hot_zone', self.config['statistics']['Invoice'])
+
+        self.config['documents']['Invoice']['hot_zone'] = True
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+        self.assertEqual(invoice.region, 0, "The hot zone should have been read without finding regions.")
+
+    def test_hot_zone_statistics(self):
+        """
+        Testing that a name found in the hot zone is counted in the statistics like one found in a region
+        :return: None
+        :rtype: None
+        """
+        self.config['statistics'] = {'Invoice': {}}
+        self.config['documents']['Invoice']['hot_zone'] = [0.0, 0.0, 1.0, 0.4]
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+
+        statistics = self.config['statistics']['Invoice']
+        self.assertGreater(invoice.region, 0)
+        self.assertEqual(1, statistics[invoice.region])
+        self.assertEqual({invoice.threshold_region_ignore: 1}, statistics['thresholds'])
+        self.assertEqual(1, len(statistics['hot_zone_boxes']))
+
+    def test_hot_zone_outlier(self):
+        """
+        Testing that one name found somewhere unusual doesn't widen the learned hot zone
+        :return: None
+        :rtype: None
+        """
+        self.config['statistics'] = {'Invoice': {}}
+        self.config['documents']['Invoice']['hot_zone_padding'] = 0
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        invoice.region = 1
+
+        for i in range(20):
+            invoice.region_box = [0.0, 0.7, 0.4, 0.95] if i == 10 else [0.5, 0.1, 0.9, 0.15]
+            invoice.record_statistics()
+
+        self.assertListEqual([0.5, 0.1, 0.9, 0.15], self.config['statistics']['Invoice']['hot_zone'])
+
+        self.config['documents']['Invoice']['hot_zone_window'] = 5
+        invoice.record_statistics()
+        self.assertEqual(5, len(self.config['statistics']['Invoice']['hot_zone_boxes']))
+
+    def test_thresholds(self):
+        """
+        Testing the order thresholds are tried in
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.config['documents']['Invoice'].update(threshold_region_ignore_min=40, threshold_region_ignore_decrement=10)
+        self.assertListEqual(invoice._thresholds(), [80, 70, 60, 50, 40])
+
+        self.config['documents']['Invoice']['threshold_search'] = 'bisect'
+        self.assertListEqual(invoice._thresholds(), [80, 40, 60, 70])
+
+        self.config['statistics'] = {'Invoice': {'thresholds': {50: 3}}}
+        self.config['documents']['Invoice']['adaptive_threshold'] = True
+        self.assertListEqual(invoice._thresholds(), [50, 80, 40, 60])
+
+    def test_region_order(self):
+        """
+        Testing that regions that found the most names are read first
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertListEqual(invoice._region_order(), invoice._regions_list)
+
+        self.config['statistics'] = {'Invoice': {7: 10, 3: 2}}
+        self.config['documents']['Invoice']['adaptive_regions'] = True
+        self.config['documents']['Invoice']['region_exploration_rate'] = 0
+        self.assertListEqual(invoice._region_order(), [[7, 3, 1, 2, 4, 5, 6, 8, 9]])
+
+    def test_name_mosaic(self):
+        """
+        Testing that reading all the regions in one OCR call finds the same name and region as reading them one by one
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+
+        self.config['documents']['Invoice']['ocr_mode'] = 'mosaic'
+        mosaic_invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, mosaic_invoice.name)
+        self.assertEqual(invoice.region, mosaic_invoice.region)
+
+    def test_name_speculative(self):
+        """
+        Testing that reading regions ahead on the thread pool finds the same name and region as reading them in turn
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+
+        self.config['documents']['Invoice'].update(ocr_mode='speculative', speculative_regions=3)
+        speculative_invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(self.test_invoice_name, speculative_invoice.name)
+        self.assertEqual(invoice.region, speculative_invoice.region)
+
+    def test_barcode(self):
+        """
+        Testing that a QR code with the invoice number is read before trying OCR
+        :return: None
+        :rtype: None
+        """
+        qr_file = Path("3-Customer_Invoice-INV-2022-11528-qr.png")
+        page = cv2.imread(self.test_invoice_file, cv2.IMREAD_GRAYSCALE)
+        qr = cv2.QRCodeEncoder.create().encode(self.test_invoice_name)
+        qr = cv2.resize(qr, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST)
+        page[50:50 + qr.shape[0], 50:50 + qr.shape[1]] = qr
+        cv2.imwrite(str(qr_file), page)
+
+        try:
+            self.config['documents']['Invoice']['barcode'] = {'symbology': 'qr'}
+            invoice = DocumentImage(self.config, qr_file)
+            self.assertEqual(self.test_invoice_name, invoice.name)
+            self.assertEqual(invoice.region, 0, "The QR code should have been read without OCR.")
+        finally:
+            qr_file.unlink()
+
+    def test_text_layer(self):
+        """
+        Testing that a PDF with a text layer is read without rendering or OCR
+        :return: None
+        :rtype: None
+        """
+        self.config['documents']['Invoice']['mime-types'].append(PDF_MIME_TYPE)
+        invoice = DocumentImage(self.config, "3-Customer_Invoice-INV-2022-11528.pdf")
+        self.assertEqual(PDF_MIME_TYPE, invoice.mime_type)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+        self.assertEqual(invoice.region, 0, "The text layer should have been read without OCR.")
+
+    def test_multi_page_tiff(self):
+        """
+        Testing that the pages of a multi-page TIFF are read one at a time until one has the name
+        :return: None
+        :rtype: None
+        """
+        tiff_file = Path("4-Customer_Invoice-INV-2022-11528.tif")
+        pages = [cv2.imread(file, cv2.IMREAD_GRAYSCALE) for file in ("bad_Customer_Invoice1.jpg", self.test_invoice_file)]
+        cv2.imwritemulti(str(tiff_file), pages)
+
+        try:
+            self.config['documents']['Invoice']['mime-types'].append(TIFF_MIME_TYPE)
+            invoice = DocumentImage(self.config, tiff_file)
+            self.assertEqual(2, invoice.page_count)
+            self.assertEqual(self.test_invoice_name, invoice.name)
+            self.assertEqual(2, invoice.page)
+            self.assertIsNone(invoice._image)
+        finally:
+            tiff_file.unlink()
+
+    def test_read_name_corrupt(self):
+        """
+        Testing that a file that can't be decoded is left unreadable instead of raising
+        :return: None
+        :rtype: None
+        """
+        corrupt_file = Path("5-Customer_Invoice-corrupt.jpg")
+        corrupt_file.write_bytes(Path(self.test_invoice_file).read_bytes()[:4] + bytes(4096))
+
+        try:
+            invoice = DocumentImage(self.config, corrupt_file)
+            self.assertRaises(ValueError, lambda: invoice.name)
+            self.assertEqual("", invoice.read_name())
+            self.assertEqual("", invoice.name)
+        finally:
+            corrupt_file.unlink()
+
+    def test_data(self):
+        """
+        Testing that the file is read once and a memory-mapped file gives the same results
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(Path(self.test_invoice_file).read_bytes(), invoice.data)
+        self.assertIs(invoice.data, invoice.data)
+
+        self.config['mmap-files'] = True
+        mapped_invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertIsInstance(mapped_invoice.data, mmap.mmap)
+        self.assertEqual(invoice.mime_type, mapped_invoice.mime_type)
+        self.assertEqual(invoice.content_hash, mapped_invoice.content_hash)
+        self.assertEqual(self.test_invoice_name, mapped_invoice.name)
+
+        mapped_invoice.close()
+        self.assertIsNone(mapped_invoice._data)
+
+    def test_checksum(self):
+        """
+        Testing that the checksum matches the one Odoo stores on ir.attachment
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.assertEqual(hashlib.sha1(Path(self.test_invoice_file).read_bytes()).hexdigest(), invoice.checksum)
+
+    def test_output(self):
+        """
+        Testing that an output profile converts what's uploaded but the name is still read from the original
+        :return: None
+        :rtype: None
+        """
+        invoice = DocumentImage(self.config, self.test_invoice_file)
+        self.config['documents'][invoice.document_type]['output'] = {'format': 'tiff-g4'}
+        data, mime_type, file_name = invoice.upload
+        self.assertEqual(TIFF_MIME_TYPE, mime_type)
+        self.assertEqual(Path(self.test_invoice_file).with_suffix('.tif').name, file_name)
+        self.assertLess(len(data) * 5, len(invoice.data))
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual('1', image.mode)
+        self.assertEqual(hashlib.sha1(data).hexdigest(), invoice.checksum)
+        self.assertEqual(self.test_invoice_name, invoice.name)
+
+    def test_output_corrupt(self):
+        """
+        Testing that a file that can't be converted is uploaded as it is instead of raising
+        :return: None
+        :rtype: None
+        """
+        corrupt_file = Path("5-Customer_Invoice-truncated.pdf")
+        corrupt_file.write_bytes(Path("3-Customer_Invoice-INV-2022-11528.pdf").read_bytes()[:300])
+
+        try:
+            self.config['documents']['Invoice']['mime-types'].append(PDF_MIME_TYPE)
+            self.config['documents']['Invoice']['output'] = {'format': 'pdf'}
+            invoice = DocumentImage(self.config, corrupt_file)
+            self.assertEqual((invoice.data, PDF_MIME_TYPE, corrupt_file.name), invoice.upload)
+        finally:
+            corrupt_file.unlink()
+
+    def test_output_checksum(self):
+        """
+        Testing that converting the same file again gives the same checksum, so it is found in Odoo again
+        :return: None
+        :rtype: None
+        """
+        for output_format in OUTPUT_FORMATS:
+            self.config['documents']['Invoice']['output'] = {'format': output_format}
+            checksum = DocumentImage(self.config, self.test_invoice_file).checksum
+            sleep(1.1)
+            self.assertEqual(checksum, DocumentImage(self.config, self.test_invoice_file).checksum, output_format)
+
     def test_odoo_sequence(self):
         invoice = DocumentImage(self.config, self.test_invoice_file)
         self.assertEqual("INV", invoice.odoo_sequence)